@@ -0,0 +1,92 @@
+import tensorflow as tf
+import multiprocessing
+import socket
+
+
+class Cluster:
+    def __init__(self, workers):
+        """
+        Describe a cluster of tensorflow servers for distributed training.
+
+        The workers should be given as a list of "host:port" addresses, each of
+        which must be running a server started by `serve`.  The first worker
+        acts as the master of the session and holds the system's variables,
+        while the others evaluate a share of each batch and send back their
+        gradients, so that every update is synchronous.  Batches are sampled
+        on the first worker, so only the evaluation of the equations is spread
+        across the cluster.
+        """
+        self.workers = list(workers)
+        self.processes = []
+
+    @property
+    def size(self):
+        """Return the number of workers in the cluster."""
+        return len(self.workers)
+
+    @property
+    def target(self):
+        """Return the address at which to open a session on the cluster."""
+        return "grpc://" + self.workers[0]
+
+    @property
+    def spec(self):
+        """Return a tensorflow specification of the cluster."""
+        return tf.train.ClusterSpec({"worker": self.workers})
+
+    def device(self, task):
+        """Return the name of the device for the worker with the given index."""
+        return "/job:worker/task:{}".format(task)
+
+    def serve(self, task):
+        """Run the server for the worker with the given index, blocking forever."""
+        serve_worker(self.workers, task)
+
+    @staticmethod
+    def local(size):
+        """
+        Start a cluster of worker processes on this machine.
+
+        Each worker runs in its own process on a free local port.  The workers
+        are stopped by `shutdown`, or when this process exits.
+        """
+        cluster = Cluster(["localhost:{}".format(port) for port in free_ports(size)])
+        context = multiprocessing.get_context("spawn")
+        for task in range(size):
+            process = context.Process(
+                target=serve_worker, args=(cluster.workers, task), daemon=True
+            )
+            process.start()
+            cluster.processes.append(process)
+        return cluster
+
+    def shutdown(self):
+        """
+        Stop any worker processes started on this machine.
+
+        Any sessions on the cluster should be closed first, as a session
+        cannot be closed once its master has stopped.
+        """
+        for process in self.processes:
+            process.kill()
+            process.join()
+        self.processes = []
+
+
+def serve_worker(workers, task):
+    """Run a tensorflow server for one worker of a cluster, blocking forever."""
+    server = tf.train.Server(
+        tf.train.ClusterSpec({"worker": workers}), job_name="worker", task_index=task
+    )
+    server.join()
+
+
+def free_ports(count):
+    """Find the given number of distinct free ports on this machine."""
+    sockets = [socket.socket() for _ in range(count)]
+    for open_socket in sockets:
+        open_socket.bind(("localhost", 0))
+    ports = [open_socket.getsockname()[1] for open_socket in sockets]
+    for open_socket in sockets:
+        open_socket.close()
+    return ports
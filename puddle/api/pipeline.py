@@ -0,0 +1,70 @@
+import tensorflow as tf
+import numpy as np
+
+
+class InputPipeline:
+    def __init__(
+        self, get_sample, independent_variables, equations, batch_size, prefetch=2
+    ):
+        """
+        Wrap a sampling function as a prefetching tensorflow input pipeline.
+
+        `get_sample` is called with the batch size and should return a sample
+        in the form given by `Sampler.get_sample`.  Samples are drawn by
+        tensorflow's background threads, so that up to `prefetch` batches are
+        prepared while training steps run.  Any independent variable or
+        equation missing from a sample is given zero values.
+        """
+        self.get_sample = get_sample
+        self.independent_variables = sorted(independent_variables)
+        self.equations = sorted(equations)
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+
+        self.iterator = self._build_iterator()
+
+    def _build_iterator(self):
+        """Create an iterator over a prefetched dataset of samples."""
+        shapes = [variable.shape for variable in self.independent_variables] + [
+            () for _ in self.equations
+        ]
+        dataset = tf.data.Dataset.from_generator(
+            self._generate_samples,
+            output_types=tuple(tf.float32 for _ in shapes),
+            output_shapes=tuple(tf.TensorShape((None,) + shape) for shape in shapes),
+        ).prefetch(self.prefetch)
+        return dataset.make_one_shot_iterator()
+
+    def _generate_samples(self):
+        """Indefinitely yield samples, flattened to a tuple of float32 arrays."""
+        while True:
+            variable_values, equation_weights = self.get_sample(self.batch_size)
+            yield tuple(
+                self._get_value(variable_values, variable, variable.shape)
+                for variable in self.independent_variables
+            ) + tuple(
+                self._get_value(equation_weights, equation, ())
+                for equation in self.equations
+            )
+
+    def _get_value(self, values, key, shape):
+        """Return a float32 copy of the sampled value, or zeros if it is absent."""
+        if key in values:
+            return np.array(values[key], dtype=np.float32)
+        else:
+            return np.zeros((self.batch_size,) + shape, dtype=np.float32)
+
+    def get_inputs(self):
+        """
+        Return nodes holding the next batch of variables and equation weights.
+
+        The nodes are returned as a tuple of two dictionaries, suitable for
+        passing as the inputs of `System.compile`.  A new batch is drawn from
+        the pipeline each time the nodes are evaluated.
+        """
+        values = self.iterator.get_next()
+        split = len(self.independent_variables)
+        return (
+            dict(zip(self.independent_variables, values[:split])),
+            dict(zip(self.equations, values[split:])),
+        )
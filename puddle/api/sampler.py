@@ -1,3 +1,7 @@
+import tensorflow as tf
+import numpy as np
+
+
 class Sampler:
     def __init__(self, independent_variables, equations):
         """Create a new sampler."""
@@ -26,6 +30,20 @@ class Sampler:
         """
         raise NotImplementedError()
 
+    def get_tensor_sample(self, size):
+        """
+        Build tensorflow nodes which draw a batch of samples within the graph.
+
+        The sample takes the same form as in `get_sample`, but with each value
+        given as a float32 node which draws a new batch whenever it is run, so
+        that no samples need to be fed to the graph.  The size may be an
+        integer or a scalar integer node.  Only samplers whose distribution is
+        known in advance can implement this.
+        """
+        raise NotImplementedError(
+            "{} cannot be sampled within the graph".format(type(self).__name__)
+        )
+
     @property
     def placeholder():
         """Create and return a placeholder sampler."""
@@ -50,6 +68,10 @@ class PlaceholderSampler(Sampler):
         """Warn the user that a placeholder sampler is selected."""
         raise Exception("a placeholder sampler is currently in use: please provide one")
 
+    def get_tensor_sample(self, size):
+        """Warn the user that a placeholder sampler is selected."""
+        raise Exception("a placeholder sampler is currently in use: please provide one")
+
 
 def wrap_in_set(values):
     """Wrap the values in a set if they are not already."""
@@ -61,3 +83,20 @@ def wrap_in_set(values):
         return set(values.values())
     else:
         return {values}
+
+
+def batch_shape(size, shape):
+    """Return a node giving the shape of a batch of values of the given shape."""
+    return tf.stack([size] + list(shape))
+
+
+def uniform_tensor(size, shape, lower, upper):
+    """Build a node drawing a batch of values uniformly between the given bounds."""
+    lower = np.asarray(lower, dtype=np.float32)
+    upper = np.asarray(upper, dtype=np.float32)
+    return lower + (upper - lower) * tf.random_uniform(batch_shape(size, shape))
+
+
+def repeat_tensor(value, size):
+    """Build a node repeating a single float value across a batch."""
+    return tf.fill(batch_shape(size, ()), np.float32(value))
@@ -0,0 +1,131 @@
+from puddle.api.sampler import Sampler
+import numpy as np
+
+
+class AdaptiveSampler(Sampler):
+    def __init__(
+        self,
+        sampler,
+        pool_size=4096,
+        uniform_fraction=0.2,
+        refresh_fraction=0.5,
+        chunk_size=1024,
+    ):
+        """
+        Draw samples from a pool of candidates in proportion to their residuals.
+
+        The pool is drawn from the given sampler, and scored by `update` using
+        the per-sample mean errors of a compiled system, evaluated in chunks of
+        `chunk_size` samples.  Each batch then draws samples from the pool with
+        probability proportional to their scores, along with a fraction of
+        fresh samples from the underlying sampler so that no region is
+        neglected.  Until the pool is scored, it is sampled uniformly.
+        """
+        super().__init__(sampler.independent_variables, sampler.equations)
+        self.sampler = sampler
+        self.pool_size = pool_size
+        self.uniform_fraction = uniform_fraction
+        self.refresh_fraction = refresh_fraction
+        self.chunk_size = chunk_size
+
+        variable_values, equation_weights = self._draw_candidates(pool_size)
+        self.pool = (variable_values, equation_weights, None)
+
+    def get_sample(self, size):
+        """
+        Retrieve a batch of samples from the sampler.
+
+        Each sample should be a tuple of two dictionaries, the first mapping
+        independent variables to their values (as numpy arrays) and the second
+        mapping equations to their weights (as floats).  All values should be
+        given as numpy arrays, where the 0th dimension is the size of the batch.
+        """
+        # Read the pool once, as it may be replaced by an update on another thread
+        variable_values, equation_weights, scores = self.pool
+        fresh_size = np.random.binomial(size, self.uniform_fraction)
+        indices = np.random.choice(
+            self.pool_size,
+            size=size - fresh_size,
+            p=scores / np.sum(scores) if scores is not None else None,
+        )
+        fresh_variables, fresh_equations = self._draw_candidates(fresh_size)
+        return (
+            self._join(variable_values, indices, fresh_variables),
+            self._join(equation_weights, indices, fresh_equations),
+        )
+
+    def update(self, system):
+        """
+        Rescore the pool with the residuals of the given compiled system.
+
+        Once the pool has been scored, the lowest-scoring fraction of it given
+        by `refresh_fraction` is first replaced with new candidates, so that
+        the pool follows the regions which the system has yet to fit.
+        """
+        variable_values, equation_weights, scores = self.pool
+        if scores is not None:
+            replaced = np.argsort(scores)[: int(self.refresh_fraction * self.pool_size)]
+            new_variables, new_equations = self._draw_candidates(len(replaced))
+            variable_values = self._replace(variable_values, replaced, new_variables)
+            equation_weights = self._replace(equation_weights, replaced, new_equations)
+
+        scores = np.concatenate(
+            [
+                self._score_chunk(system, variable_values, equation_weights, start)
+                for start in range(0, self.pool_size, self.chunk_size)
+            ]
+        )
+        if not np.sum(scores) > 0:
+            scores = None
+        self.pool = (variable_values, equation_weights, scores)
+
+    def update_during_training(self, trainer, update_frequency):
+        """Rescore the pool every n epochs during training."""
+        trainer.every(update_frequency, lambda trainer, _: self.update(trainer.system))
+
+    def _score_chunk(self, system, variable_values, equation_weights, start):
+        """Evaluate the mean error of each candidate in one chunk of the pool."""
+        end = min(start + self.chunk_size, self.pool_size)
+        values = {**variable_values, **equation_weights}
+        feed_dict = {}
+        for variable in system.compiler.independent_variables:
+            shape = (end - start,) + variable.shape
+            feed_dict[variable] = (
+                values[variable][start:end] if variable in values else np.zeros(shape)
+            )
+        for equation in system.compiler.equations:
+            feed_dict[equation] = (
+                values[equation][start:end]
+                if equation in values
+                else np.zeros((end - start,))
+            )
+        return np.abs(
+            system.session.run(
+                system.graph.get_mean_errors(), system.graph.get_inputs(feed_dict)
+            )
+        )
+
+    def _draw_candidates(self, size):
+        """Draw new candidates from the underlying sampler, copying the arrays."""
+        variable_values, equation_weights = self.sampler.get_sample(size)
+        return (
+            {key: np.array(value) for key, value in variable_values.items()},
+            {key: np.array(value) for key, value in equation_weights.items()},
+        )
+
+    @staticmethod
+    def _join(pool_values, indices, fresh_values):
+        """Join the chosen samples from the pool with fresh ones for each key."""
+        return {
+            key: np.concatenate([values[indices], fresh_values[key]], axis=0)
+            for key, values in pool_values.items()
+        }
+
+    @staticmethod
+    def _replace(pool_values, indices, new_values):
+        """Return a copy of the pool with the given samples replaced."""
+        replaced = {}
+        for key, values in pool_values.items():
+            replaced[key] = values.copy()
+            replaced[key][indices] = new_values[key]
+        return replaced
@@ -1,18 +1,25 @@
 from puddle.api.sampler import Sampler
+import numpy as np
 
 
-class AnonymousSampler(Sampler):
+class BatchedAnonymousSampler(Sampler):
     def __init__(
-        self,
-        independent_variables,
-        equations,
-        single_variable_sample,
-        single_equation_sample,
+        self, independent_variables, equations, variable_sample, equation_sample
     ):
-        """Class for samplers that can be constructed on the fly."""
+        """
+        Class for samplers that can be constructed on the fly from batches.
+
+        Both functions are called with the size of the batch.  The first should
+        return a dictionary mapping each independent variable to an array of its
+        values, and the second a dictionary mapping equations to arrays of their
+        weights.  Weights may also be given as single floats, and equations
+        which are left out are given zero weight.  The shapes of the values are
+        checked on the first batch.
+        """
         super().__init__(independent_variables, equations)
-        self.single_variable_sample = single_variable_sample
-        self.single_equation_sample = single_equation_sample
+        self.variable_sample = variable_sample
+        self.equation_sample = equation_sample
+        self.validated = False
 
     def get_sample(self, size):
         """
@@ -23,22 +30,89 @@ class AnonymousSampler(Sampler):
         mapping equations to their weights (as floats).  All values should be
         given as numpy arrays, where the 0th dimension is the size of the batch.
         """
-        variable_samples = [self.single_variable_sample() for _ in range(size)]
-        equation_samples = [self.single_equation_sample() for _ in range(size)]
-        variable_outputs, equation_outputs = (
-            {variable: [] for variable in self.independent_variables},
-            {equation: [] for equation in self.equations},
+        variable_values = self.variable_sample(size)
+        equation_weights = self.equation_sample(size)
+        if not self.validated and size > 0:
+            self._validate(size, variable_values, equation_weights)
+            self.validated = True
+
+        return (
+            {
+                variable: np.asarray(variable_values[variable])
+                for variable in self.independent_variables
+            },
+            {
+                equation: self._expand_weight(equation_weights.get(equation, 0.0), size)
+                for equation in self.equations
+            },
+        )
+
+    def _validate(self, size, variable_values, equation_weights):
+        """Check that a batch has a value of the right shape for every key."""
+        for variable in self.independent_variables:
+            if variable not in variable_values:
+                raise ValueError("no sample provided for {}".format(str(variable)))
+            shape = np.shape(variable_values[variable])
+            if shape != (size,) + variable.shape:
+                raise ValueError(
+                    "expected samples of shape {} for {}, but got {}".format(
+                        (size,) + variable.shape, str(variable), shape
+                    )
+                )
+        for equation, weights in equation_weights.items():
+            if np.ndim(weights) != 0 and np.shape(weights) != (size,):
+                raise ValueError(
+                    "expected weights of shape {} for {}, but got {}".format(
+                        (size,), str(equation), np.shape(weights)
+                    )
+                )
+
+    @staticmethod
+    def _expand_weight(weights, size):
+        """Repeat a single weight across the batch, or pass an array through."""
+        return np.full((size,), weights) if np.ndim(weights) == 0 else weights
+
+
+class AnonymousSampler(BatchedAnonymousSampler):
+    def __init__(
+        self,
+        independent_variables,
+        equations,
+        single_variable_sample,
+        single_equation_sample,
+    ):
+        """
+        Class for samplers that can be constructed on the fly.
+
+        The functions are called once for each sample in a batch, and should
+        return dictionaries for a single sample.  For large batches, a
+        `BatchedAnonymousSampler` avoids this per-sample overhead.
+        """
+        super().__init__(
+            independent_variables,
+            equations,
+            self._sample_variables,
+            self._sample_equations,
         )
-        for sample in variable_samples:
-            for variable in variable_outputs:
-                if variable in sample:
-                    variable_outputs[variable].append(sample[variable])
-                else:
-                    raise ValueError("no sample provided for {}".format(str(variable)))
-        for sample in equation_samples:
-            for equation in equation_outputs:
-                if equation in sample:
-                    equation_outputs[equation].append(sample[equation])
-                else:
-                    equation_outputs[equation].append(0.0)
-        return variable_outputs, equation_outputs
+        self.single_variable_sample = single_variable_sample
+        self.single_equation_sample = single_equation_sample
+
+    def _sample_variables(self, size):
+        """Collect a batch of independent variable values from single samples."""
+        samples = [self.single_variable_sample() for _ in range(size)]
+        variable_values = {}
+        for variable in self.independent_variables:
+            if not all(variable in sample for sample in samples):
+                raise ValueError("no sample provided for {}".format(str(variable)))
+            variable_values[variable] = np.reshape(
+                [sample[variable] for sample in samples], (size,) + variable.shape
+            )
+        return variable_values
+
+    def _sample_equations(self, size):
+        """Collect a batch of equation weights from single samples."""
+        samples = [self.single_equation_sample() for _ in range(size)]
+        return {
+            equation: np.array([sample.get(equation, 0.0) for sample in samples])
+            for equation in self.equations
+        }
@@ -0,0 +1,186 @@
+from puddle.api.sampler import Sampler, batch_shape, uniform_tensor
+from puddle.api.samplers.space import ordered_spaces, space_size
+import tensorflow as tf
+import numpy as np
+
+
+class BoxBoundarySampler(Sampler):
+    def __init__(self, spaces, face_equations, weights="area"):
+        """
+        Sample the faces of the bounding box of a set of spaces.
+
+        Each face pins one component of one space to its lower or upper bound,
+        while every other component is drawn uniformly within its bounds.  A
+        face of a scalar is written as (space, "lower") or (space, "upper"),
+        and a face of a vector as (space, component, "lower") or similar.  The
+        faces to sample are the keys of `face_equations`, each of which maps to
+        a dictionary of equation weights for samples on that face, where any
+        equations that are left out are given zero weight.
+
+        Faces are chosen in proportion to their area if `weights` is "area",
+        or otherwise in proportion to a dictionary of weights for each face.
+        """
+        super().__init__(
+            spaces,
+            {eq for equations in face_equations.values() for eq in equations},
+        )
+        self.spaces = ordered_spaces(spaces)
+        self.lowers, self.uppers, self.offsets = self._get_bounds()
+
+        self.faces = [self._normalise_face(face) for face in face_equations]
+        self.equation_list = list(self.equations)
+        self.pinned_components = np.array(
+            [self._get_component(face) for face in self.faces]
+        )
+        self.pinned_values = np.array(
+            [self._get_bound(face) for face in self.faces], dtype=np.float64
+        )
+        self.face_weights = np.array(
+            [
+                [equations.get(equation, 0.0) for equation in self.equation_list]
+                for equations in face_equations.values()
+            ],
+            dtype=np.float64,
+        ).reshape((len(self.faces), len(self.equation_list)))
+        self.probabilities = self._get_probabilities(face_equations, weights)
+
+    def _get_bounds(self):
+        """Flatten the bounds of every component of the spaces into arrays."""
+        lowers, uppers, offsets, offset = [], [], {}, 0
+        for space in self.spaces:
+            size = space_size(space)
+            lowers.append(np.reshape(np.broadcast_to(space.lower, space.shape), size))
+            uppers.append(np.reshape(np.broadcast_to(space.upper, space.shape), size))
+            offsets[space] = offset
+            offset += size
+        return (
+            np.concatenate(lowers).astype(np.float64),
+            np.concatenate(uppers).astype(np.float64),
+            offsets,
+        )
+
+    def _normalise_face(self, face):
+        """Write a face as a (space, component, side) tuple."""
+        if len(face) == 2:
+            face = (face[0], None, face[1])
+        space, component, side = face
+        if space not in self.independent_variables:
+            raise ValueError("{} is not one of the sampled spaces".format(str(space)))
+        if side not in ("lower", "upper"):
+            raise ValueError("the side of a face must be 'lower' or 'upper'")
+        if (component is None) != (space.shape == ()):
+            raise ValueError(
+                "faces of vectors must give a component, and faces of scalars must not"
+            )
+        if component is not None and not 0 <= component < space_size(space):
+            raise ValueError(
+                "component {} is out of range for {}".format(component, str(space))
+            )
+        return face
+
+    def _get_component(self, face):
+        """Return the index of the component pinned by a face."""
+        space, component, _ = face
+        return self.offsets[space] + (component or 0)
+
+    def _get_bound(self, face):
+        """Return the value at which a face pins its component."""
+        bounds = self.lowers if face[2] == "lower" else self.uppers
+        return bounds[self._get_component(face)]
+
+    def _get_probabilities(self, face_equations, weights):
+        """Work out the probability with which each face is sampled."""
+        if weights == "area":
+            extents = self.uppers - self.lowers
+            values = [
+                np.prod(np.delete(extents, self._get_component(face)))
+                for face in self.faces
+            ]
+        else:
+            values = [weights.get(face, 0.0) for face in face_equations]
+        values = np.array(values, dtype=np.float64)
+        if not np.sum(values) > 0:
+            raise ValueError("the faces must have a positive total weight")
+        return values / np.sum(values)
+
+    def get_sample(self, size):
+        """
+        Retrieve a batch of samples from the sampler.
+
+        Each sample should be a tuple of two dictionaries, the first mapping
+        independent variables to their values (as numpy arrays) and the second
+        mapping equations to their weights (as floats).  All values should be
+        given as numpy arrays, where the 0th dimension is the size of the batch.
+        """
+        choices = np.random.choice(len(self.faces), size=size, p=self.probabilities)
+        values = self.lowers + (self.uppers - self.lowers) * np.random.random(
+            (size, len(self.lowers))
+        )
+        pinned = (np.arange(size), self.pinned_components[choices])
+        values[pinned] = self.pinned_values[choices]
+        # Gather the weights with equations as rows, so each one is contiguous
+        weights = np.take(self.face_weights.T, choices, axis=1)
+        return (
+            {
+                space: np.reshape(
+                    values[:, offset : offset + space_size(space)],
+                    (size,) + space.shape,
+                )
+                for space, offset in self.offsets.items()
+            },
+            {
+                equation: weights[index]
+                for index, equation in enumerate(self.equation_list)
+            },
+        )
+
+    def get_tensor_sample(self, size):
+        """Build nodes which sample the faces within the graph."""
+        # Faces which are never chosen are left out, as they have no log-probability
+        faces = np.flatnonzero(self.probabilities)
+        choices = tf.gather(
+            faces.astype(np.int32),
+            tf.multinomial(
+                np.log([self.probabilities[faces]]).astype(np.float32),
+                size,
+                output_dtype=tf.int32,
+            )[0],
+        )
+        values = uniform_tensor(size, self.lowers.shape, self.lowers, self.uppers)
+        pinned = tf.equal(
+            tf.range(len(self.lowers)),
+            tf.gather(self.pinned_components.astype(np.int32), choices)[:, None],
+        )
+        pinned_values = tf.gather(self.pinned_values.astype(np.float32), choices)
+        values = tf.where(
+            pinned, tf.tile(pinned_values[:, None], [1, len(self.lowers)]), values
+        )
+        weights = tf.gather(self.face_weights.astype(np.float32), choices)
+        return (
+            {
+                space: tf.reshape(
+                    values[:, offset : offset + space_size(space)],
+                    batch_shape(size, space.shape),
+                )
+                for space, offset in self.offsets.items()
+            },
+            {
+                equation: weights[:, index]
+                for index, equation in enumerate(self.equation_list)
+            },
+        )
+
+    @staticmethod
+    def all_faces(spaces):
+        """List every face of the bounding box of the given spaces."""
+        faces = []
+        for space in ordered_spaces(spaces):
+            for side in ("lower", "upper"):
+                if space.shape == ():
+                    faces.append((space, side))
+                else:
+                    faces.extend(
+                        (space, component, side)
+                        for component in range(space_size(space))
+                    )
+        return faces
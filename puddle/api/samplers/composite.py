@@ -1,37 +1,41 @@
-from puddle.api.sampler import Sampler
+from puddle.api.sampler import Sampler, batch_shape
+import tensorflow as tf
 import numpy as np
 
 
 class CompositeSampler(Sampler):
-    def __init__(self, sampler_weights):
-        """Create a sampler that draws from other samplers with varying probability."""
+    def __init__(self, sampler_weights, decay=0.9):
+        """
+        Create a sampler that draws from other samplers with varying probability.
+
+        The recent error of each component can be tracked with `update_errors`,
+        averaging over batches with the given decay, and used by `rebalance`
+        to shift the probabilities towards the components with most error.
+        """
         super().__init__(
             *Sampler.aggregate_variables_and_equations(
                 [sampler for sampler, _ in sampler_weights]
             )
         )
         self.sampler_data = self._get_sampler_data(sampler_weights)
+        self.decay = decay
+        self.last_allocation = None
 
     def _get_sampler_data(self, sampler_weights):
         """Produce a list of SamplerData objects describing the components."""
         total_weight = self._get_total_weight(sampler_weights)
-        cumulative_threshold = 0.0
         sampler_data = []
 
         for sampler, weight in sampler_weights:
-            cumulative_threshold += weight / total_weight
             sampler_data.append(
                 SamplerData(
                     sampler,
-                    cumulative_threshold,
+                    weight / total_weight,
                     self.independent_variables - sampler.independent_variables,
                     self.equations - sampler.equations,
                 )
             )
 
-        # Prevent any issues due to rounding at the last sampler:
-        sampler_data[-1].cumulative_threshold += 1.0
-
         return sampler_data
 
     def _get_total_weight(self, sampler_weights):
@@ -39,60 +43,154 @@ class CompositeSampler(Sampler):
         return sum([w for s, w in sampler_weights])
 
     def get_sample(self, size):
-        """Retrieve a batch of samples from the sampler."""
-        randoms = np.sort(np.random.uniform(size=size))
-
-        variable_samples, equation_samples = [], []
-        current_sample_size = 0
-        current_sampler_index = 0
-        current_random_index = 0
-
-        while current_random_index <= size:
-            if current_random_index == size or (
-                randoms[current_random_index]
-                > self.sampler_data[current_sampler_index].cumulative_threshold
-            ):
-                if current_sample_size > 0:
-                    new_variables, new_equations = self.sampler_data[
-                        current_sampler_index
-                    ].get_sample(current_sample_size)
-                    variable_samples.append(new_variables)
-                    equation_samples.append(new_equations)
-                current_sample_size = 0
-                current_sampler_index += 1
-                if current_random_index == size:
-                    break
-            else:
-                current_sample_size += 1
-                current_random_index += 1
+        """
+        Retrieve a batch of samples from the sampler.
+
+        The number of samples drawn from each component is chosen with a single
+        multinomial draw, and each component writes its samples directly into
+        a slice of float32 output arrays, which are newly allocated together
+        for each batch.
+        """
+        allocation = np.random.multinomial(
+            size, [data.probability for data in self.sampler_data]
+        )
+        variable_buffers, equation_buffers = self._allocate_buffers(size)
+
+        start = 0
+        for data, count in zip(self.sampler_data, allocation):
+            if count > 0:
+                data.write_sample(count, start, variable_buffers, equation_buffers)
+            start += count
+
+        self.last_allocation = allocation.tolist()
+        return variable_buffers, equation_buffers
+
+    def _allocate_buffers(self, size):
+        """Allocate the output arrays for a batch as views of a single block."""
+        shapes = [
+            (variable, (size,) + variable.shape)
+            for variable in self.independent_variables
+        ] + [(equation, (size,)) for equation in self.equations]
+        block = np.empty(
+            sum(int(np.prod(shape)) for _, shape in shapes), dtype=np.float32
+        )
+
+        buffers, start = {}, 0
+        for key, shape in shapes:
+            end = start + int(np.prod(shape))
+            buffers[key] = block[start:end].reshape(shape)
+            start = end
+        return (
+            {variable: buffers[variable] for variable in self.independent_variables},
+            {equation: buffers[equation] for equation in self.equations},
+        )
+
+    def update_errors(self, mean_errors, allocation=None):
+        """
+        Track the recent error of each component from a batch's sample errors.
+
+        The errors should be given in the order of the batch, which was drawn
+        with the given allocation of samples to components, by default the
+        allocation of the most recent batch.
+        """
+        allocation = allocation if allocation is not None else self.last_allocation
+        start = 0
+        for data, count in zip(self.sampler_data, allocation):
+            if count > 0:
+                error = np.mean(mean_errors[start : start + count])
+                data.error = (
+                    error
+                    if data.error is None
+                    else self.decay * data.error + (1.0 - self.decay) * error
+                )
+            start += count
+
+    def rebalance(self, mix=0.5):
+        """
+        Move the component probabilities towards their share of recent error.
+
+        Each new probability mixes the component's original weight with its
+        share of the tracked errors, in the proportion given by `mix`.
+        Components without a tracked error are given the mean of the others.
+        The probabilities are updated in place, without rebuilding the sampler,
+        though samples drawn within the graph keep the probabilities they were
+        built with.
+        """
+        errors = [data.error for data in self.sampler_data if data.error is not None]
+        if len(errors) == 0 or not sum(errors) > 0:
+            return
+        default_error = np.mean(errors)
+        errors = [
+            data.error if data.error is not None else default_error
+            for data in self.sampler_data
+        ]
+        total_error = sum(errors)
+
+        for data, error in zip(self.sampler_data, errors):
+            share = error / total_error
+            data.probability = (1.0 - mix) * data.base_probability + mix * share
+
+    def get_tensor_sample(self, size):
+        """Build nodes which draw from the component samplers within the graph."""
+        log_probabilities = np.log(
+            [[data.probability for data in self.sampler_data]]
+        ).astype(np.float32)
+        choices = tf.multinomial(log_probabilities, size, output_dtype=tf.int32)
+        counts = tf.bincount(choices[0], minlength=len(self.sampler_data))
+
+        variable_samples, equation_samples = zip(
+            *[
+                data.get_tensor_sample(counts[i])
+                for i, data in enumerate(self.sampler_data)
+            ]
+        )
         return (
-            self._concatenate_samples(variable_samples, self.independent_variables),
-            self._concatenate_samples(equation_samples, self.equations),
+            self._concatenate_tensor_samples(
+                variable_samples, self.independent_variables
+            ),
+            self._concatenate_tensor_samples(equation_samples, self.equations),
         )
 
-    def _concatenate_samples(self, samples, keys):
-        """Given a list of dictionaries, concatenate samples for each key."""
+    def _concatenate_tensor_samples(self, samples, keys):
+        """Given a list of dictionaries of nodes, concatenate samples for each key."""
         return {
-            key: np.concatenate([sample_batch[key] for sample_batch in samples], axis=0)
+            key: tf.concat([sample_batch[key] for sample_batch in samples], axis=0)
             for key in keys
         }
 
 
 class SamplerData:
     def __init__(
-        self, sampler, cumulative_threshold, default_variables, default_equations
+        self,
+        sampler,
+        probability,
+        default_variables,
+        default_equations,
     ):
         """Data class for storing information on a component of a composite sampler."""
         self.sampler = sampler
-        self.cumulative_threshold = cumulative_threshold
+        self.probability = probability
+        self.base_probability = probability
+        self.error = None
         self.default_variables = default_variables
         self.default_equations = default_equations
 
-    def get_sample(self, size):
-        """Take a sample and fill in any missing variables and equations."""
+    def write_sample(self, size, start, variable_buffers, equation_buffers):
+        """Write a sample into slices of the buffers, zeroing missing values."""
         variable_values, equation_weights = self.sampler.get_sample(size)
+        end = start + size
+        for values, buffers in [
+            (variable_values, variable_buffers),
+            (equation_weights, equation_buffers),
+        ]:
+            for key, buffer in buffers.items():
+                buffer[start:end] = values[key] if key in values else 0.0
+
+    def get_tensor_sample(self, size):
+        """Build nodes for a sample, filling in any missing variables and equations."""
+        variable_values, equation_weights = self.sampler.get_tensor_sample(size)
         for variable in self.default_variables:
-            variable_values[variable] = np.zeros((size,) + variable.shape)
+            variable_values[variable] = tf.zeros(batch_shape(size, variable.shape))
         for equation in self.default_equations:
-            equation_weights[equation] = np.zeros((size,))
+            equation_weights[equation] = tf.zeros(batch_shape(size, ()))
         return variable_values, equation_weights
@@ -1,4 +1,5 @@
-from puddle.api.sampler import Sampler
+from puddle.api.sampler import Sampler, uniform_tensor, repeat_tensor
+from puddle.util.sequences import make_sequence
 import numpy as np
 
 
@@ -16,7 +17,7 @@ class SpaceSampler(Sampler):
     def _setup_space_lambdas(self):
         """Create a dictionary of functions to sample from each space individually."""
         self.space_lambdas = {
-            space: lambda s: np.random.uniform(
+            space: lambda s, space=space: np.random.uniform(
                 low=space.lower, high=space.upper, size=(s,) + space.shape
             )
             for space in self.independent_variables
@@ -26,6 +27,19 @@ class SpaceSampler(Sampler):
         """Sample the space uniformly."""
         return self._execute_lambdas(size), self._get_equation_weights(size)
 
+    def get_tensor_sample(self, size):
+        """Build nodes which sample the space uniformly within the graph."""
+        return (
+            {
+                space: uniform_tensor(size, space.shape, space.lower, space.upper)
+                for space in self.independent_variables
+            },
+            {
+                equation: repeat_tensor(self.normalised_weight, size)
+                for equation in self.equations
+            },
+        )
+
     def _execute_lambdas(self, size):
         """Execute each of the space lambdas in turn."""
         return {
@@ -61,7 +75,7 @@ class ConstrainedSpaceSampler(Sampler):
 
     def _get_equations(self, size):
         """Get the equations portion of the sample."""
-        return {eq: np.repeat(w, size) for w, size in self.equation_weights.items()}
+        return {eq: np.repeat(w, size) for eq, w in self.equation_weights.items()}
 
     def get_sample(self, size):
         """
@@ -81,7 +95,129 @@ class ConstrainedSpaceSampler(Sampler):
             self._get_equations(size),
         )
 
+    def get_tensor_sample(self, size):
+        """Build nodes which sample the constrained subspace within the graph."""
+        return (
+            {
+                self.space: uniform_tensor(
+                    size, self.space.shape, self.lowers, self.uppers
+                )
+            },
+            {
+                equation: repeat_tensor(weight, size)
+                for equation, weight in self.equation_weights.items()
+            },
+        )
+
     @staticmethod
     def point(space, equations, coordinates):
         """Create a sampler that repeatedly samples a single point."""
         return ConstrainedSpaceSampler(space, equations, [(x, x) for x in coordinates])
+
+
+class QuasiRandomSpaceSampler(SpaceSampler):
+    def __init__(
+        self, spaces, valid_equations, sequence="sobol", scramble=True, seed=None
+    ):
+        """
+        Create a sampler that covers a space with a low-discrepancy sequence.
+
+        The sequence may be "sobol", "halton" or "latin", and is shared
+        between the components of all of the spaces.  Later batches continue
+        the sequence rather than restarting it, so that together they still
+        cover the space evenly.  Sobol batches are most even when their size
+        is a power of two.  The spaces take the dimensions of the sequence in
+        the order they are listed, so that a seed always gives the same points.
+        """
+        super().__init__(spaces, valid_equations)
+        self.spaces = ordered_spaces(spaces)
+        self.sequence = make_sequence(
+            sequence, sum(space_size(space) for space in self.spaces), scramble, seed
+        )
+
+    def get_tensor_sample(self, size):
+        """Quasi-random sequences cannot be drawn within the graph."""
+        raise NotImplementedError("quasi-random samples must be fed to the graph")
+
+    def _execute_lambdas(self, size):
+        """Split the next points of the sequence between the spaces."""
+        points = self.sequence.next(size)
+        values, start = {}, 0
+        for space in self.spaces:
+            end = start + space_size(space)
+            values[space] = scale_points(
+                points[:, start:end], space.shape, space.lower, space.upper
+            )
+            start = end
+        return values
+
+
+class QuasiRandomConstrainedSampler(ConstrainedSpaceSampler):
+    def __init__(
+        self,
+        space,
+        valid_equations,
+        dimension_bounds,
+        sequence="sobol",
+        scramble=True,
+        seed=None,
+    ):
+        """
+        Sample from a constrained subspace with a low-discrepancy sequence.
+
+        The bounds are given as for `ConstrainedSpaceSampler`, and the sequence
+        as for `QuasiRandomSpaceSampler`.
+        """
+        super().__init__(space, valid_equations, dimension_bounds)
+        self.sequence = make_sequence(sequence, space_size(space), scramble, seed)
+
+    def get_sample(self, size):
+        """
+        Retrieve a batch of samples from the sampler.
+
+        Each sample should be a tuple of two dictionaries, the first mapping
+        independent variables to their values (as numpy arrays) and the second
+        mapping equations to their weights (as floats).  All values should be
+        given as numpy arrays, where the 0th dimension is the size of the batch.
+        """
+        points = self.sequence.next(size)
+        return (
+            {
+                self.space: scale_points(
+                    points, self.space.shape, self.lowers, self.uppers
+                )
+            },
+            self._get_equations(size),
+        )
+
+    def get_tensor_sample(self, size):
+        """Quasi-random sequences cannot be drawn within the graph."""
+        raise NotImplementedError("quasi-random samples must be fed to the graph")
+
+
+def ordered_spaces(spaces):
+    """
+    List the spaces without repeats, keeping the order in which they were given.
+
+    Spaces given as a set are ordered by creation instead, so that the order
+    never depends on how the set happens to be hashed.
+    """
+    if isinstance(spaces, set):
+        return sorted(spaces)
+    elif isinstance(spaces, dict):
+        spaces = spaces.values()
+    elif not isinstance(spaces, (list, tuple)):
+        spaces = [spaces]
+    return list(dict.fromkeys(spaces))
+
+
+def space_size(space):
+    """Return the number of components in a single value of a space."""
+    return int(np.prod(space.shape))
+
+
+def scale_points(points, shape, lower, upper):
+    """Scale points in the unit hypercube to the bounds of a space."""
+    lower = np.reshape(np.broadcast_to(lower, shape), (-1,))
+    upper = np.reshape(np.broadcast_to(upper, shape), (-1,))
+    return np.reshape(lower + points * (upper - lower), (len(points),) + shape)
@@ -1,4 +1,5 @@
-from puddle.api.sampler import Sampler
+from puddle.api.sampler import Sampler, batch_shape, repeat_tensor
+import tensorflow as tf
 import numpy as np
 
 
@@ -8,10 +9,6 @@ class SubspaceSampler(Sampler):
         super().__init__(variable, equations)
         self.intrinsic_shape = intrinsic_shape
         self.variable = variable
-
-        self.vectorised_map = lambda l: np.array(
-            [self.map_latent_variables(_l) for _l in l]
-        )
         self.equation_weight = 1.0 / len(self.equations)
 
     def _get_latent_variables(self, size):
@@ -22,6 +19,15 @@ class SubspaceSampler(Sampler):
         """Map the latent variables into the space of the sampler."""
         raise NotImplementedError()
 
+    def map_latent_batch(self, latent_batch):
+        """
+        Map a batch of latent variables into the space of the sampler.
+
+        By default, each sample is mapped in turn by `map_latent_variables`.
+        Subclasses may override this to map the whole batch at once.
+        """
+        return np.array([self.map_latent_variables(latent) for latent in latent_batch])
+
     def get_sample(self, size):
         """
         Retrieve a batch of samples from the sampler.
@@ -33,7 +39,7 @@ class SubspaceSampler(Sampler):
         """
         weights = np.repeat(self.equation_weight, size)
         return (
-            {self.variable: self.vectorised_map(self._get_latent_variables(size))},
+            {self.variable: self.map_latent_batch(self._get_latent_variables(size))},
             {equation: weights for equation in self.equations},
         )
 
@@ -59,6 +65,27 @@ class HyperplaneSampler(SubspaceSampler):
         """Map the latent variables into the space of the sampler."""
         return np.squeeze(self.origin + np.sum(self.axes * latent_tensor, axis=0))
 
+    def map_latent_batch(self, latent_batch):
+        """Map a batch of latent variables into the space with one product."""
+        points = self.origin + np.matmul(latent_batch[..., 0], self.axes)
+        return points.reshape(
+            (len(points),) + tuple(length for length in points.shape[1:] if length != 1)
+        )
+
+    def get_tensor_sample(self, size):
+        """Build nodes which sample the hyperplane within the graph."""
+        latent = tf.random_uniform(batch_shape(size, self.intrinsic_shape[:1]))
+        points = np.asarray(self.origin, dtype=np.float32) + tf.matmul(
+            latent, self.axes.astype(np.float32)
+        )
+        return (
+            {self.variable: tf.reshape(points, batch_shape(size, self.variable.shape))},
+            {
+                equation: repeat_tensor(self.equation_weight, size)
+                for equation in self.equations
+            },
+        )
+
     @staticmethod
     def _preformat_axes(axes):
         """Format the axes to be in the form of a rank-2 numpy tensor."""
@@ -1,13 +1,44 @@
 from puddle.construction.repository import PuddleRepository
 from puddle.construction.compiler import Compiler
+from puddle.construction.cache import GraphCache
 from puddle.api.sampler import Sampler
+from puddle.util.jit import jit_scope, session_config
 import tensorflow as tf
 import numpy as np
 
 
 class System:
-    def __init__(self, independent_variables=None, equations=None):
-        """Set up a system of equations with some user-friendly functions exposed."""
+    def __init__(
+        self,
+        independent_variables=None,
+        equations=None,
+        vectorise=False,
+        outputs=None,
+        cache_directory=None,
+        jit=False,
+        sparse=False,
+        cluster=None,
+    ):
+        """
+        Set up a system of equations with some user-friendly functions exposed.
+
+        If `vectorise` is set, the system is compiled once over the whole batch
+        rather than separately for each sample.  Variables given as `outputs`
+        are exported alongside the equations; see `Compiler`.  If a cache
+        directory is given, compiled graphs are saved there and restored by
+        later processes building the same system.
+
+        If `jit` is set, the compiled graph and exported functions are compiled
+        with XLA, which removes much of the per-node overhead of small graphs
+        on the CPU.  This works best alongside `vectorise`, as XLA cannot
+        always cluster the loop used to map over samples.
+
+        If `sparse` is set along with `vectorise`, equations are only evaluated
+        on the samples which give them a non-zero weight.
+
+        If a `Cluster` is given, the session runs on the cluster rather than
+        in this process, and trainers split each batch between its workers.
+        """
         self.independent_variables = (
             independent_variables
             if independent_variables is not None
@@ -17,9 +48,22 @@ class System:
             equations if equations is not None else PuddleRepository.equations
         )
 
-        self.compiler = Compiler(self.independent_variables, self.equations)
+        self.compiler = Compiler(
+            self.independent_variables,
+            self.equations,
+            vectorise=vectorise,
+            outputs=outputs,
+            cache=GraphCache(cache_directory) if cache_directory is not None else None,
+            sparse=sparse,
+            jit=jit,
+        )
         self.graph = None
-        self.session = tf.Session()
+        self.jit = jit
+        self.cluster = cluster
+        self.session = tf.Session(
+            cluster.target if cluster is not None else "",
+            config=session_config(jit=self.jit),
+        )
 
         PuddleRepository.most_recent_system = self
 
@@ -28,9 +72,15 @@ class System:
         """Determine whether or not the system has been compiled."""
         return self.graph is not None
 
-    def compile(self, initialise=True):
-        """Compile a tensorflow graph for the system."""
-        self.graph = self.compiler.compile()
+    def compile(self, initialise=True, inputs=None):
+        """
+        Compile a tensorflow graph for the system.
+
+        The graph is fed through placeholders unless `inputs` gives nodes to
+        use in their place; see `Compiler.compile`.
+        """
+        with jit_scope(self.jit):
+            self.graph = self.compiler.compile(inputs=inputs)
 
         if initialise:
             self.initialise()
@@ -38,6 +88,36 @@ class System:
         self.run = lambda ins, outs: self.graph.run(self.session, ins, feed_dict=outs)
         return self
 
+    def add_outputs(self, variables):
+        """
+        Export more variables from the compiled graph alongside the equations.
+
+        Variables added before compilation are simply compiled with the rest.
+        Afterwards, a graph mapped over samples (or restored from the cache)
+        is recompiled on its existing inputs, so that the variables come out
+        of the one map rather than each needing a map of its own.  Returns
+        whether the system was recompiled.
+        """
+        compiler = self.compiler
+        variables = [
+            variable
+            for variable in variables
+            if variable not in compiler.outputs
+            and variable not in compiler.equations
+            and variable not in compiler.independent_variables
+        ]
+        compiler.outputs.update(variables)
+        if len(variables) == 0 or not self.compiled:
+            return False
+        if compiler.vectorise and self.graph.compilation_data is not None:
+            return False
+
+        self.compile(
+            initialise=False,
+            inputs=(self.graph.variable_nodes, self.graph.equation_nodes["weights"]),
+        )
+        return True
+
     def initialise(self):
         """Initialise variables for the current tensorflow session."""
         self.session.run(tf.global_variables_initializer())
@@ -47,7 +127,10 @@ class System:
         Export a variable to a callable function that calculates it directly.
 
         If the arguments are left blank and the variable is a dependent variable,
-        its default arguments will be used in that order.
+        its default arguments will be used in that order.  The function runs
+        through a separate inference graph, compiled over whole batches even
+        if the system maps over samples, which shares its trained weights but
+        none of its training nodes.
         """
         if not self.compiled:
             raise Exception(
@@ -56,9 +139,10 @@ class System:
 
         arguments = variable.arguments if arguments is None else list_wrap(arguments)
 
-        output_node = self.graph.get_outputs(variable)
+        with jit_scope(self.jit):
+            inference_graph = self.compiler.compile_inference(variable, arguments)
 
-        def wrap_input(input_tensor):
+        def wrap_input(argument, input_tensor):
             single_wrapped = (
                 input_tensor
                 if isinstance(input_tensor, np.ndarray)
@@ -66,21 +150,21 @@ class System:
             )
             return (
                 single_wrapped
-                if len(single_wrapped.shape) == len(variable.shape) + 1
+                if len(single_wrapped.shape) == len(argument.shape) + 1
                 else np.array([single_wrapped])
             )
 
         def make_feed_dict(fed_arguments):
-            return self.graph.get_inputs(
-                {
-                    arg: wrap_input(fed_arg)
-                    for arg, fed_arg in zip(arguments, fed_arguments)
-                }
-            )
+            return {
+                arg: wrap_input(arg, fed_arg)
+                for arg, fed_arg in zip(arguments, fed_arguments)
+            }
 
         def calculate(*inputs):
             """Calculate the value of a variable as a function of its arguments."""
-            output = self.session.run(output_node, feed_dict=make_feed_dict(inputs))
+            output = inference_graph.run(
+                self.session, variable, feed_dict=make_feed_dict(inputs)
+            )
             if unwrap_single_values and output.shape[0] == 1:
                 return output[0]
             else:
@@ -1,8 +1,15 @@
 from puddle.api.system import System
-from puddle.api.sampler import Sampler
+from puddle.api.sampler import Sampler, batch_shape
 from puddle.api.samplers.space import SpaceSampler
 from puddle.api.samplers.composite import CompositeSampler
+from puddle.api.pipeline import InputPipeline
+from puddle.util.jit import jit_scope
+from puddle.util.worker import BackgroundWorker, MainThreadCall
+from puddle.util.tensors import gradients
+from puddle.util import lbfgs
 import tensorflow as tf
+import numpy as np
+import time
 
 
 class Trainer:
@@ -14,19 +21,38 @@ class Trainer:
         batch_size=None,
         pre_batch_callbacks=None,
         post_batch_callbacks=None,
+        jit=None,
     ):
-        """Create a trainer which handles the fitting of a system of equations."""
+        """
+        Create a trainer which handles the fitting of a system of equations.
+
+        If `jit` is set, the optimiser's update is compiled with XLA.  It
+        defaults to the setting of the system being trained.
+        """
         self.batch_number = 0
         self.epoch = None
 
         self.queries = {}
+        self.query_periods = {}
+        self.full_query_periods = set()
 
         self.error = None
         self.optimise_op = None
 
         self.sampler = None
+        self.input_pipeline = None
+        self.graph_inputs = None
+        self.graph_input_function = None
+        self.training_loop = None
+        self.steps_node = None
+        self.refinement_nodes = None
+        self.callback_periods = set()
+        self.callback_worker = None
+        self.steps_per_second = None
 
         self.system = system if system is not None else System()
+        self.jit = jit if jit is not None else self.system.jit
+        self.towers = self.system.cluster.size if self.system.cluster is not None else 1
         self.sampler_list = samplers if samplers is not None else []
         self.optimiser = optimiser if optimiser is not None else self.default_optimiser
         self.batch_size = batch_size or 32
@@ -57,7 +83,8 @@ class Trainer:
     @property
     def default_post_batch_callbacks(self):
         """Return a list of default post-batch callbacks."""
-        self.add_query("epoch", "error")
+        self.add_query("epoch", "error", period=100)
+        self.callback_periods.add(100)
 
         def log_epoch(trainer, data):
             if data["epoch"] % 100 == 0:
@@ -77,35 +104,461 @@ class Trainer:
         self.sampler_list.append((sampler, weight))
         self.refresh_sampler()
 
+    def use_input_pipeline(self, prefetch=2):
+        """
+        Feed training batches from a prefetching input pipeline.
+
+        The system is recompiled on the outputs of an `InputPipeline` drawing
+        from the trainer's sampler, so that the next batches are sampled in the
+        background while training steps run.  The batch size is fixed when the
+        pipeline is created, and pre-batch callbacks receive `None` in place of
+        the sample, which is no longer available in Python.
+        """
+        self.input_pipeline = InputPipeline(
+            lambda size: self.sampler.get_sample(size),
+            self.system.compiler.independent_variables,
+            self.system.compiler.equations,
+            self.batch_size,
+            prefetch=prefetch,
+        )
+        self.use_graph_inputs(self.input_pipeline.get_inputs)
+
+    def use_graph_sampling(self):
+        """
+        Draw training batches within the graph rather than feeding them.
+
+        The system is recompiled on the nodes built by the sampler's
+        `get_tensor_sample`, so that each training step draws its own batch
+        without any sampling or copying in Python.  This requires every
+        registered sampler to support sampling within the graph.  As with an
+        input pipeline, pre-batch callbacks receive `None` for the sample.
+        """
+        self.use_graph_inputs(lambda: self.sampler.get_tensor_sample(self.batch_size))
+
+    def use_graph_inputs(self, get_inputs):
+        """
+        Recompile the system to train on nodes which produce their own batches.
+
+        `get_inputs` should build and return a tuple of two dictionaries,
+        mapping independent variables and equations to nodes; any which are
+        missing are given zero values.  It may be called again to build fresh
+        inputs, such as inside a multi-step training loop.  Existing queries
+        are rebuilt on the new graph.
+        """
+        self.graph_input_function = get_inputs
+        self.graph_inputs = self._get_graph_inputs()
+        self.system.compile(
+            initialise=not self.system.compiled, inputs=self.graph_inputs
+        )
+        self._rebuild_training()
+
+    def _rebuild_training(self):
+        """Rebuild the optimiser update and queries after the system recompiles."""
+        self.optimise_op = None
+        self.training_loop = None
+        self.initialise_training()
+        self.queries = {
+            variable: self._get_query_node(variable) for variable in self.queries
+        }
+
+    def _get_graph_inputs(self):
+        """Build a new set of graph inputs, filling in any missing values."""
+        variable_nodes, equation_nodes = self.graph_input_function()
+        batch_size = tf.shape(
+            next(iter({**variable_nodes, **equation_nodes}.values()))
+        )[0]
+        return (
+            {
+                variable: (
+                    variable_nodes[variable]
+                    if variable in variable_nodes
+                    else tf.zeros(batch_shape(batch_size, variable.shape))
+                )
+                for variable in self.system.compiler.independent_variables
+            },
+            {
+                equation: (
+                    equation_nodes[equation]
+                    if equation in equation_nodes
+                    else tf.zeros(batch_shape(batch_size, ()))
+                )
+                for equation in self.system.compiler.equations
+            },
+        )
+
+    def use_asynchronous_callbacks(self, queue_size=8, policy="block"):
+        """
+        Run post-batch callbacks on a background thread.
+
+        Each callback receives its own copy of the queries, so that slow
+        callbacks such as visualisation no longer hold up training.  At most
+        `queue_size` batches of queries wait to be processed; when the queue
+        is full, the policy "block" waits for space while "drop" skips the
+        callbacks for that batch.  Callbacks must be safe to call from another
+        thread, and have all finished by the time `train` returns.
+
+        Work that must happen on the main thread, such as drawing matplotlib
+        figures, should be returned from the callback wrapped in a
+        `MainThreadCall`, which is then called on the main thread after a
+        later step or when `train` returns.  The visualisations'
+        `update_during_training` does this.
+        """
+        if policy not in ["block", "drop"]:
+            raise ValueError("unknown callback policy '{}'".format(policy))
+        self.callback_worker = BackgroundWorker(
+            self._run_post_batch_callbacks,
+            queue_size=queue_size,
+            block=policy == "block",
+        )
+
+    def use_towers(self, towers):
+        """
+        Split each training batch between several replicas of the system.
+
+        Each tower compiles the system's equations on its share of the batch.
+        Their gradients are combined, weighted by the size of each share, into
+        the gradient of the whole batch, which is used for a single optimiser
+        update.  The towers are independent, so tensorflow can evaluate them in
+        parallel across the cores of the machine.  If the system runs on a
+        cluster, the towers are placed on its workers in turn, and by default
+        there is one tower for each worker.  Only the equations are evaluated
+        by the towers: batches are still sampled, split and fed on the first
+        worker, which sends each tower its share.
+        """
+        if towers < 1:
+            raise ValueError("the number of towers must be at least one")
+        self.towers = towers
+        self._rebuild_training()
+
+    def _build_update(self, inputs, graph=None):
+        """
+        Build an optimiser update on the given inputs, returning it with the error.
+
+        A graph already compiled on the inputs may be given to be reused when
+        the batch is not split between towers.
+        """
+        if self.towers == 1:
+            if graph is None:
+                graph = self.system.compiler.compile(
+                    inputs=inputs, export_outputs=False
+                )
+            error = graph.get_batch_mean_error()
+            return self.optimiser.minimize(error), error
+
+        variable_nodes, weight_nodes = inputs
+        batch_size = tf.shape(next(iter(weight_nodes.values())))[0]
+        partitions = tf.range(batch_size) % self.towers
+
+        def split(nodes):
+            return {
+                key: tf.dynamic_partition(node, partitions, self.towers)
+                for key, node in nodes.items()
+            }
+
+        variable_shards, weight_shards = split(variable_nodes), split(weight_nodes)
+
+        # Normalising by the whole batch makes the towers' losses sum to its mean
+        tower_gradients, error = [], 0.0
+        for tower in range(self.towers):
+            with tf.name_scope("tower_{}".format(tower)), tf.device(
+                self._get_tower_device(tower)
+            ):
+                # Copy the shard to the tower's device, where a map can use it
+                tower_graph = self.system.compiler.compile(
+                    inputs=(
+                        {
+                            key: tf.identity(shards[tower])
+                            for key, shards in variable_shards.items()
+                        },
+                        {
+                            key: tf.identity(shards[tower])
+                            for key, shards in weight_shards.items()
+                        },
+                    ),
+                    export_outputs=False,
+                )
+                loss = tf.reduce_sum(tower_graph.get_mean_errors()) / tf.cast(
+                    batch_size, tf.float32
+                )
+                tower_gradients.append(self.optimiser.compute_gradients(loss))
+                error += loss
+
+        return self.optimiser.apply_gradients(sum_gradients(tower_gradients)), error
+
+    def _get_tower_device(self, tower):
+        """Return the device for a tower, or None to place it automatically."""
+        if self.system.cluster is None:
+            return None
+        return self.system.cluster.device(tower % self.system.cluster.size)
+
     def initialise_training(self):
         """Check that everything is in place for training to begin."""
         if not self.system.compiled:
             self.system.compile()
 
         if self.optimise_op is None:
-            self.error = self.system.graph.get_batch_mean_error()
-            self.optimise_op = self.optimiser.minimize(self.error)
+            inputs = (
+                self.system.graph.variable_nodes,
+                self.system.graph.equation_nodes["weights"],
+            )
+            with jit_scope(self.jit):
+                self.optimise_op, self.error = self._build_update(
+                    inputs, self.system.graph
+                )
             self.system.session.run(
                 tf.variables_initializer(self.optimiser.variables())
             )
 
-    def train(self, iterations):
-        """Train the system for the specified number of iterations."""
+    def train(self, iterations, steps_per_call=1):
+        """
+        Train the system for the specified number of iterations.
+
+        If `steps_per_call` is greater than one, up to that many optimiser
+        steps are taken inside each session call by a graph loop, which
+        requires the trainer to use graph inputs (see `use_graph_sampling` and
+        `use_input_pipeline`).  Steps are split into calls so that callbacks
+        registered through `every` fire at the right epochs; other callbacks
+        fire once per call.  One set of query results is returned per call.
+
+        The rate of training over the call is stored in `steps_per_second`.
+        """
+        if steps_per_call > 1 and self.graph_inputs is None:
+            raise ValueError(
+                "taking multiple steps per call requires the trainer to use graph "
+                "inputs: see use_graph_sampling and use_input_pipeline"
+            )
+
         self.initialise_training()
         epochs = []
+        steps_taken = 0
 
+        start_time = time.perf_counter()
         try:
-            for _ in range(iterations):
-                queries = self.perform_training_iteration()
+            while steps_taken < iterations:
+                if steps_per_call > 1:
+                    steps = self._get_steps_before_callback(
+                        min(steps_per_call, iterations - steps_taken)
+                    )
+                    queries = self.perform_training_steps(steps)
+                else:
+                    steps = 1
+                    queries = self.perform_training_iteration()
                 epochs.append(queries)
+                steps_taken += steps
+        except KeyboardInterrupt:
+            pass
+        elapsed_time = time.perf_counter() - start_time
+
+        if steps_taken > 0 and elapsed_time > 0:
+            self.steps_per_second = steps_taken / elapsed_time
+
+        if self.callback_worker is not None:
+            self.callback_worker.flush()
+
+        return epochs
+
+    def refine(self, size, iterations=500, memory=10, chunk_size=4096):
+        """
+        Refine the fit with L-BFGS over a fixed set of samples.
+
+        A set of `size` samples is drawn once from the registered samplers, and
+        the mean error over the whole set is minimised with L-BFGS; see
+        `puddle.util.lbfgs`.  The error and its gradient are evaluated in
+        chunks of at most `chunk_size` samples to bound memory use.
+
+        Each iteration counts as an epoch, triggering callbacks as in `train`,
+        with queries evaluated on the first chunk of the set except for
+        "error", which gives the error over the whole set.  The set is
+        shuffled, so that the first chunk is drawn from every sampler.
+        Pre-batch callbacks receive `None` for the sample, and the samplers
+        are not rebalanced on the errors of the set.
+        """
+        self.initialise_training()
+        session = self.system.session
+        chunks = self._get_frozen_chunks(size, chunk_size)
+        parameters, loss, parameter_gradients, assign = self._get_refinement_nodes()
+        epochs = []
+
+        def evaluate(point):
+            assign(point)
+            value, gradient = 0.0, np.zeros_like(point)
+            for chunk in chunks:
+                chunk_value, chunk_gradients = session.run(
+                    (loss, parameter_gradients), chunk
+                )
+                value += float(chunk_value)
+                gradient += flatten_values(chunk_gradients)
+            return value / size, gradient / size
+
+        best_point = flatten_values(session.run(parameters))
+
+        def report(point, value):
+            nonlocal best_point
+            best_point = point
+            self._trigger_pre_batch_events(None)
+            queries = self._fetch_queries(
+                lambda fetches: session.run(
+                    fetches, {**chunks[0], self._get_epoch_node(): self.batch_number}
+                )
+            )
+            if "error" in queries:
+                queries["error"] = value
+            self._trigger_post_batch_events(queries)
+            self.batch_number += 1
+            epochs.append(queries)
+
+        try:
+            lbfgs.minimise(
+                evaluate, best_point, iterations, memory=memory, callback=report
+            )
         except KeyboardInterrupt:
             pass
 
+        # The last evaluation may have been a rejected step of the line search
+        assign(best_point)
+
+        if self.callback_worker is not None:
+            self.callback_worker.flush()
+
         return epochs
 
+    def _get_frozen_chunks(self, size, chunk_size):
+        """Draw a fixed set of samples in random order, split into chunks to feed."""
+        variable_values, equation_weights = self.sampler.get_sample(size)
+        order = np.random.permutation(size)
+        values = {
+            key: np.asarray(value)[order]
+            for key, value in {**variable_values, **equation_weights}.items()
+        }
+        for variable in self.system.compiler.independent_variables:
+            if variable not in values:
+                values[variable] = np.zeros((size,) + variable.shape)
+        for equation in self.system.compiler.equations:
+            if equation not in values:
+                values[equation] = np.zeros((size,))
+
+        return [
+            self.system.graph.get_inputs(
+                {
+                    key: np.array(value[start : start + chunk_size])
+                    for key, value in values.items()
+                }
+            )
+            for start in range(0, size, chunk_size)
+        ]
+
+    def _get_refinement_nodes(self):
+        """
+        Get the nodes used to evaluate the error of a chunk and set parameters.
+
+        Returns the network weights of the system, the summed error of a chunk
+        with its gradients, and a function assigning a flat vector to the
+        weights.
+        """
+        if (
+            self.refinement_nodes is None
+            or self.refinement_nodes[0] is not self.system.graph
+        ):
+            parameters = self.system.compiler.get_parameters()
+            loss = tf.reduce_sum(self.system.graph.get_mean_errors())
+            placeholders = [
+                tf.placeholder(parameter.dtype.base_dtype, parameter.shape)
+                for parameter in parameters
+            ]
+            assign_op = tf.group(
+                *[
+                    parameter.assign(placeholder)
+                    for parameter, placeholder in zip(parameters, placeholders)
+                ]
+            )
+            self.refinement_nodes = (
+                self.system.graph,
+                parameters,
+                loss,
+                gradients(loss, parameters),
+                placeholders,
+                assign_op,
+            )
+
+        _, parameters, loss, parameter_gradients, placeholders, assign_op = (
+            self.refinement_nodes
+        )
+        shapes = [tuple(parameter.shape.as_list()) for parameter in parameters]
+
+        def assign(point):
+            self.system.session.run(
+                assign_op, dict(zip(placeholders, unflatten_values(point, shapes)))
+            )
+
+        return parameters, loss, parameter_gradients, assign
+
+    def _get_steps_before_callback(self, steps):
+        """Limit a number of steps to end at the next epoch a callback fires."""
+        for period in self.callback_periods:
+            steps = min(steps, (-self.batch_number) % period + 1)
+        return steps
+
+    def perform_training_steps(self, steps):
+        """
+        Train the system for several steps in one call, triggering events once.
+
+        All but the last step are taken by a graph loop, and the last is taken
+        along with the queries, so that they describe the final training batch
+        without drawing another.  "error" gives the mean batch error over all
+        of the steps taken.
+        """
+        self._trigger_pre_batch_events(None)
+        loop_error = (
+            self.system.session.run(
+                self._get_training_loop(), {self.steps_node: steps - 1}
+            )
+            if steps > 1
+            else 0.0
+        )
+        self.batch_number += steps - 1
+
+        last_errors = []
+
+        def run(fetches):
+            values, error, _ = self.system.session.run(
+                (fetches, self.error, self.optimise_op),
+                {self._get_epoch_node(): self.batch_number},
+            )
+            last_errors.append(error)
+            return values
+
+        queries = self._fetch_queries(run)
+        if "error" in queries:
+            queries["error"] = (loop_error * (steps - 1) + last_errors[0]) / steps
+
+        self._trigger_post_batch_events(queries)
+        self.batch_number += 1
+        return queries
+
+    def _get_training_loop(self):
+        """Get a graph loop taking several optimiser steps on fresh graph inputs."""
+        if self.training_loop is None:
+            self.steps_node = tf.placeholder(tf.int32, shape=())
+
+            def body(step, error_sum):
+                update, error = self._build_update(self._get_graph_inputs())
+                with tf.control_dependencies([update]):
+                    return step + 1, error_sum + error
+
+            with jit_scope(self.jit):
+                _, error_sum = tf.while_loop(
+                    lambda step, _: step < self.steps_node, body, (0, 0.0)
+                )
+            self.training_loop = error_sum / tf.cast(self.steps_node, tf.float32)
+        return self.training_loop
+
     def perform_training_iteration(self):
         """Train the system on one batch, including triggering all events."""
-        sample = self.sampler.get_joined_sample(self.batch_size)
+        sample = (
+            self.sampler.get_joined_sample(self.batch_size)
+            if self.graph_inputs is None
+            else None
+        )
         self._trigger_pre_batch_events(sample)
         queries = self._train_on_batch(sample)
         self._trigger_post_batch_events(queries)
@@ -121,20 +574,78 @@ class Trainer:
     def _trigger_post_batch_events(self, queries):
         """Call all callbacks on the results of the given queries."""
         if len(self.post_batch_callbacks) > 0:
-            for callback in self.post_batch_callbacks:
-                callback(self, queries)
+            if self.callback_worker is not None:
+                self.callback_worker.submit(
+                    {
+                        variable: (
+                            value.copy() if isinstance(value, np.ndarray) else value
+                        )
+                        for variable, value in queries.items()
+                    }
+                )
+            else:
+                completion = self._run_post_batch_callbacks(queries)
+                if completion is not None:
+                    completion()
+
+    def _run_post_batch_callbacks(self, queries):
+        """
+        Call each post-batch callback in turn.
+
+        Returns a function calling any `MainThreadCall` the callbacks returned,
+        which is run straight away unless the callbacks are run in the
+        background.
+        """
+        completions = [
+            callback(self, queries) for callback in self.post_batch_callbacks
+        ]
+        completions = [c for c in completions if isinstance(c, MainThreadCall)]
+        if len(completions) == 0:
+            return None
+
+        def complete():
+            for completion in completions:
+                completion()
+
+        return complete
 
     def _train_on_batch(self, sample):
-        """Optimise network parameters on the given sample."""
-        feed_dict = self.system.graph.get_inputs(sample)
+        """Optimise network parameters on the given sample, or the pipeline's."""
+        feed_dict = self.system.graph.get_inputs(sample) if sample is not None else {}
         feed_dict[self._get_epoch_node()] = self.batch_number
 
-        queries, _ = self.system.session.run(
-            (self.queries, self.optimise_op), feed_dict
+        return self._fetch_queries(
+            lambda fetches: self.system.session.run(
+                (fetches, self.optimise_op), feed_dict
+            )[0]
+        )
+
+    def _fetch_queries(self, run):
+        """
+        Evaluate the queries due at the current epoch using the given function.
+
+        The function is passed a dictionary of the nodes to fetch, and should
+        return their values.  The epoch is filled in without being fetched.
+        """
+        queries = run(
+            {
+                variable: node
+                for variable, node in self.queries.items()
+                if variable != "epoch" and self._is_query_due(variable)
+            }
         )
+        if "epoch" in self.queries:
+            queries["epoch"] = self.batch_number
         return queries
 
-    def add_query(self, *variables):
+    def _is_query_due(self, variable):
+        """Determine whether a query is needed at the current epoch."""
+        return any(
+            period is None or self.batch_number % period == 0
+            for period in self.query_periods[variable] | self.full_query_periods
+        )
+
+    def add_query(self, *variables, period=None):
         """
         Add a query for a variable whose value will be returned during training.
 
@@ -142,26 +653,42 @@ class Trainer:
         the mean error for each sample in the batch, pass in "mean_error", or
         to get overall error simply type "error".  "epoch" gives the current
         training epoch.
+
+        By default, queries are fetched on every step.  If a period is given,
+        the query is only fetched on epochs which are a multiple of it, unless
+        it has also been added without one.
+
+        Queried variables are exported from the system's compiled graph; see
+        `System.add_outputs`.  Adding them after compilation may recompile the
+        system, which resets the optimiser's state, so queries are best added
+        before training starts.
         """
+        if self.system.add_outputs(
+            [variable for variable in variables if not isinstance(variable, str)]
+        ):
+            self._rebuild_training()
         self.initialise_training()
         for variable in variables:
-            if variable in self.queries:
-                continue
-
-            if isinstance(variable, str):
-                options = self._get_string_query_options()
-                if variable in options:
-                    self.queries[variable] = options[variable]()
-                else:
-                    raise ValueError("variable '{}' unknown".format(variable))
+            if variable not in self.queries:
+                self.queries[variable] = self._get_query_node(variable)
+            self.query_periods.setdefault(variable, set()).add(period)
+
+    def _get_query_node(self, variable):
+        """Get the node which gives the value of a query."""
+        if isinstance(variable, str):
+            options = self._get_string_query_options()
+            if variable in options:
+                return options[variable]()
             else:
-                self.queries[variable] = self.system.graph.get_output(variable)
+                raise ValueError("variable '{}' unknown".format(variable))
+        else:
+            return self.system.graph.get_outputs(variable)
 
     def _get_string_query_options(self):
         """Get a list of options which can be used to add non-variable queries."""
         return {
             "mean_error": lambda: self.system.graph.get_mean_errors(),
-            "error": lambda: self.system.graph.get_batch_mean_error(),
+            "error": lambda: self.error,
             "epoch": lambda: self._get_epoch_node(),
         }
 
@@ -171,12 +698,84 @@ class Trainer:
             self.epoch = tf.placeholder(tf.int32, shape=())
         return self.epoch
 
-    def every(self, period, callback):
-        """Perform a post-batch callback every n epochs."""
+    def every(self, period, callback, queries=None):
+        """
+        Perform a post-batch callback every n epochs.
+
+        Any queries the callback needs may be given, in which case they are
+        only fetched on the epochs where the callback fires.  Otherwise, every
+        query is fetched on those epochs, including any added later.
+        """
         self.add_query("epoch")
+        if queries is not None:
+            self.add_query(*queries, period=period)
+        else:
+            self.full_query_periods.add(period)
+        self.callback_periods.add(period)
 
         def wrapped_callback(trainer, queries):
             if queries["epoch"] % period == 0:
-                callback(trainer, queries)
+                return callback(trainer, queries)
 
         self.post_batch_callbacks.append(wrapped_callback)
+
+    def rebalance_samplers(self, period, mix=0.5):
+        """
+        Shift the weights of the samplers towards those with most error.
+
+        The error of each sampler's share of every batch is tracked, and every
+        n epochs the composite sampler is rebalanced; see
+        `CompositeSampler.rebalance`.  This requires batches to be sampled in
+        Python, rather than by an input pipeline or within the graph.
+        """
+        if self.graph_inputs is not None:
+            raise ValueError("samplers can only be rebalanced on fed samples")
+
+        # Record allocations by epoch, as callbacks may run after the next sample
+        allocations = {}
+
+        def record_allocation(trainer, sample):
+            # Epochs without a fed batch, such as those of `refine`, are skipped
+            if sample is not None:
+                allocations[trainer.batch_number] = trainer.sampler.last_allocation
+
+        def track_errors(trainer, queries):
+            # Discard the allocations of any batches whose callbacks were dropped
+            for epoch in list(allocations):
+                if epoch < queries["epoch"]:
+                    del allocations[epoch]
+            if queries["epoch"] in allocations:
+                trainer.sampler.update_errors(
+                    queries["mean_error"], allocations.pop(queries["epoch"])
+                )
+
+        self.add_query("epoch", "mean_error")
+        self.pre_batch_callbacks.append(record_allocation)
+        self.post_batch_callbacks.append(track_errors)
+        self.every(period, lambda trainer, _: trainer.sampler.rebalance(mix))
+
+
+def sum_gradients(tower_gradients):
+    """Sum lists of gradient-variable pairs computed for the same variables."""
+    gradients_and_variables = []
+    for pairs in zip(*tower_gradients):
+        gradients = [gradient for gradient, _ in pairs if gradient is not None]
+        gradients_and_variables.append(
+            (tf.add_n(gradients) if len(gradients) > 0 else None, pairs[0][1])
+        )
+    return gradients_and_variables
+
+
+def flatten_values(values):
+    """Concatenate a list of arrays into one flat float64 vector."""
+    return np.concatenate([np.ravel(value) for value in values]).astype(np.float64)
+
+
+def unflatten_values(vector, shapes):
+    """Split a flat vector into arrays of the given shapes."""
+    values, start = [], 0
+    for shape in shapes:
+        end = start + int(np.prod(shape))
+        values.append(vector[start:end].reshape(shape))
+        start = end
+    return values
@@ -0,0 +1,324 @@
+from puddle.construction.variable import Variable
+from puddle.construction.compiler import CompiledGraph, CompilationStructure
+import tensorflow as tf
+import numpy as np
+import functools
+import hashlib
+import json
+import os
+
+
+class GraphCache:
+
+    # Attributes which differ between processes without changing the system
+    volatile_attributes = {
+        "id",
+        "callable",
+        "apply_to",
+        "build_function",
+        "compile_function",
+        "input_variables",
+        "network_input_dict",
+    }
+
+    def __init__(self, directory):
+        """
+        Create an on-disk cache of compiled graphs, keyed by system structure.
+
+        Each entry stores a MetaGraph of the compiled graph alongside a mapping
+        from variables to the names of their nodes.  Variables are identified
+        by their position in the system, so an entry is only reused by a
+        system built from the same variables in the same order.
+        """
+        self.directory = directory
+
+    def load(self, compiler):
+        """Restore a compiled graph for the compiler's system, if one is cached."""
+        labels = self.get_labels(compiler)
+        meta_path, mapping_path = self._get_paths(self.get_key(compiler, labels))
+        if not (os.path.exists(meta_path) and os.path.exists(mapping_path)):
+            return None
+
+        with open(mapping_path) as mapping_file:
+            mapping = json.load(mapping_file)
+        variables = {label: variable for variable, label in labels.items()}
+
+        # Reuse the network weights of this process rather than the saved ones
+        input_map = {
+            name: parameter.handle
+            for label, names in mapping["parameters"].items()
+            for name, parameter in zip(names, variables[int(label)].parameters)
+        }
+
+        graph = tf.get_default_graph()
+        scope = graph.unique_name("cached_graph", mark_as_used=False)
+        tf.train.import_meta_graph(meta_path, import_scope=scope, input_map=input_map)
+
+        def restore(names):
+            return {
+                variables[int(label)]: graph.get_tensor_by_name(scope + "/" + name)
+                for label, name in names.items()
+            }
+
+        equation_nodes = {
+            key: restore(mapping["equation_nodes"][key])
+            for key in ["unweighted", "weights", "weighted"]
+        }
+        for key in ["mean", "batch_mean"]:
+            equation_nodes[key] = graph.get_tensor_by_name(
+                scope + "/" + mapping["equation_nodes"][key]
+            )
+
+        return CompiledGraph(
+            compiler,
+            restore(mapping["variable_nodes"]),
+            equation_nodes,
+            restore(mapping["all_nodes"]),
+        )
+
+    def save(self, compiler, compiled_graph):
+        """Save a compiled graph so that it can be restored by a later process."""
+        labels = self.get_labels(compiler)
+        meta_path, mapping_path = self._get_paths(self.get_key(compiler, labels))
+        os.makedirs(self.directory, exist_ok=True)
+
+        def names(nodes):
+            return {
+                str(labels[variable]): node.name for variable, node in nodes.items()
+            }
+
+        equation_nodes = {
+            key: names(compiled_graph.equation_nodes[key])
+            for key in ["unweighted", "weights", "weighted"]
+        }
+        for key in ["mean", "batch_mean"]:
+            equation_nodes[key] = compiled_graph.equation_nodes[key].name
+
+        mapping = {
+            "variable_nodes": names(compiled_graph.variable_nodes),
+            "equation_nodes": equation_nodes,
+            "all_nodes": names(compiled_graph.all_nodes),
+            "parameters": {
+                str(label): [parameter.handle.name for parameter in variable.parameters]
+                for variable, label in labels.items()
+                if hasattr(variable, "parameters")
+            },
+        }
+
+        nodes = [compiled_graph.variable_nodes, compiled_graph.all_nodes] + [
+            compiled_graph.equation_nodes[key]
+            for key in ["unweighted", "weights", "weighted"]
+        ]
+        outputs = [node for group in nodes for node in group.values()] + [
+            compiled_graph.equation_nodes[key] for key in ["mean", "batch_mean"]
+        ]
+        with open(meta_path, "wb") as meta_file:
+            meta_file.write(self.export_subgraph(outputs).SerializeToString())
+        with open(mapping_path, "w") as mapping_file:
+            json.dump(mapping, mapping_file)
+
+    def export_subgraph(self, outputs):
+        """
+        Export the part of the default graph needed to calculate the outputs.
+
+        Nodes built by trainers or other systems are left out.  The control flow
+        contexts of the remaining loops and conditions are kept, as they are
+        needed to differentiate through a restored map.
+        """
+        graph = tf.get_default_graph()
+        graph_def = tf.graph_util.extract_sub_graph(
+            graph.as_graph_def(), sorted({output.op.name for output in outputs})
+        )
+        kept = {node.name for node in graph_def.node}
+
+        meta_graph = tf.train.export_meta_graph(graph_def=graph_def, collection_list=[])
+        for key in ["while_context", "cond_context"]:
+            for context in graph.get_collection(key):
+                if context.pivot.op.name in kept:
+                    context_def = context.to_proto()
+                    prune_context(context_def, kept)
+                    meta_graph.collection_def[key].bytes_list.value.append(
+                        context_def.SerializeToString()
+                    )
+        return meta_graph
+
+    def get_labels(self, compiler):
+        """Label every variable in the system by its order of creation."""
+        structure = CompilationStructure()
+        for variable in (
+            list(compiler.independent_variables)
+            + list(compiler.equations)
+            + list(compiler.outputs)
+        ):
+            structure.set_variable(variable)
+        variables = sorted(
+            [
+                variable
+                for variable in structure.structure
+                if isinstance(variable, Variable)
+            ]
+        )
+        return {variable: label for label, variable in enumerate(variables)}
+
+    def get_key(self, compiler, labels):
+        """Hash the structure of the system and the compiler's settings."""
+        description = {
+            "tensorflow": tf.__version__,
+            "puddle": source_hash(),
+            "vectorise": compiler.vectorise,
+            "canonicalise": compiler.canonicalise,
+            "sparse": compiler.sparse,
+            "jit": compiler.jit,
+            "equation_groups": sorted(
+                sorted(labels[e] for e in group)
+                for group in compiler.get_equation_groups()
+            ),
+            "independent_variables": sorted(
+                [labels[v] for v in compiler.independent_variables]
+            ),
+            "equations": sorted([labels[e] for e in compiler.equations]),
+            "outputs": sorted([labels[o] for o in compiler.outputs]),
+            "variables": [
+                self.describe_variable(variable, labels)
+                for variable in sorted(labels, key=lambda v: labels[v])
+            ],
+        }
+        encoded = json.dumps(description, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def describe_variable(self, variable, labels):
+        """Describe a variable by its type and attributes, labelling variables."""
+        return [
+            type(variable).__module__ + "." + type(variable).__qualname__,
+            [
+                [name, self.describe(value, labels)]
+                for name, value in sorted(vars(variable).items())
+                if name not in self.volatile_attributes
+            ],
+        ]
+
+    def describe(self, value, labels, seen=frozenset()):
+        """Produce a JSON-compatible description of an attribute value."""
+        if isinstance(value, Variable):
+            return "#{}".format(labels[value]) if value in labels else "#?"
+        elif isinstance(value, (list, tuple, set)):
+            described = [self.describe(v, labels, seen) for v in value]
+            return sorted(described, key=str) if isinstance(value, set) else described
+        elif isinstance(value, dict):
+            return sorted(
+                [
+                    [self.describe(k, labels, seen), self.describe(v, labels, seen)]
+                    for k, v in value.items()
+                ],
+                key=str,
+            )
+        elif isinstance(value, np.ndarray):
+            return [value.dtype.str, list(value.shape), value.tobytes().hex()]
+        elif isinstance(value, (str, int, float, bool)) or value is None:
+            return repr(value)
+        elif callable(value):
+            return self.describe_callable(value, labels, seen)
+        else:
+            return type(value).__name__
+
+    def describe_callable(self, value, labels, seen):
+        """
+        Describe a function by where it is defined and the values it captures.
+
+        Functions defined in the same place differ only by their closures and
+        defaults, such as the axis of a stack or the batched variant of a
+        wrapped function, so these are described too.
+        """
+        if id(value) in seen:
+            return "recursive"
+        seen = seen | {id(value)}
+
+        described = []
+        function = value
+        while function is not None:
+            code = getattr(function, "__code__", None)
+            closure = getattr(function, "__closure__", None) or ()
+            described.append(
+                [
+                    "{}.{}:{}".format(
+                        getattr(function, "__module__", ""),
+                        getattr(function, "__qualname__", type(function).__name__),
+                        code.co_firstlineno if code is not None else "",
+                    ),
+                    [self.describe_cell(cell, labels, seen) for cell in closure],
+                    self.describe(
+                        getattr(function, "__defaults__", None), labels, seen
+                    ),
+                    self.describe(
+                        getattr(function, "__kwdefaults__", None), labels, seen
+                    ),
+                ]
+            )
+            function = getattr(function, "__wrapped__", None)
+        return described
+
+    def describe_cell(self, cell, labels, seen):
+        """Describe the value held by a closure cell."""
+        try:
+            contents = cell.cell_contents
+        except ValueError:
+            return "empty"
+        return self.describe(contents, labels, seen)
+
+    def _get_paths(self, key):
+        """Return the paths of the MetaGraph and mapping files for a cache key."""
+        return (
+            os.path.join(self.directory, key + ".meta"),
+            os.path.join(self.directory, key + ".json"),
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def source_hash():
+    """
+    Hash the source of the puddle package.
+
+    Graphs compiled by a different version of puddle may be built
+    differently, so they are never reused.
+    """
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha256()
+    for directory, subdirectories, files in os.walk(package):
+        subdirectories.sort()
+        for name in sorted(files):
+            if name.endswith(".py"):
+                path = os.path.join(directory, name)
+                digest.update(os.path.relpath(path, package).encode("utf-8"))
+                with open(path, "rb") as source_file:
+                    digest.update(source_file.read())
+    return digest.hexdigest()
+
+
+def prune_context(context_def, kept):
+    """Remove the nodes that were left out of an export from a control flow context."""
+
+    def is_kept(name):
+        return name.lstrip("^").split(":")[0] in kept
+
+    values = [value for value in context_def.values_def.values if is_kept(value)]
+    del context_def.values_def.values[:]
+    context_def.values_def.values.extend(values)
+    external_values = context_def.values_def.external_values
+    for key in list(external_values):
+        if not (is_kept(key) and is_kept(external_values[key])):
+            del external_values[key]
+
+    for field in ["loop_enter_names", "loop_exit_names"]:
+        if hasattr(context_def, field):
+            names = [name for name in getattr(context_def, field) if is_kept(name)]
+            del getattr(context_def, field)[:]
+            getattr(context_def, field).extend(names)
+
+    nested_contexts = []
+    for nested in context_def.nested_contexts:
+        nested_def = getattr(nested, nested.WhichOneof("ctxt"))
+        if is_kept(nested_def.pivot_name):
+            prune_context(nested_def, kept)
+            nested_contexts.append(nested)
+    del context_def.nested_contexts[:]
+    context_def.nested_contexts.extend(nested_contexts)
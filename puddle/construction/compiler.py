@@ -1,49 +1,235 @@
-from puddle.construction.variable import Variable
+from puddle.construction.variable import Variable, product
 from puddle.construction.constant import Constant
+from puddle.util.tensors import jacobian, jacobians
 import tensorflow as tf
 
 
 class Compiler:
-    def __init__(self, independent_variables, equations):
-        """Create a compiler to build a tensorflow graph from a set of variables."""
+    def __init__(
+        self,
+        independent_variables,
+        equations,
+        vectorise=False,
+        canonicalise=True,
+        outputs=None,
+        cache=None,
+        sparse=False,
+        equation_groups=None,
+        jit=False,
+    ):
+        """
+        Create a compiler to build a tensorflow graph from a set of variables.
+
+        By default the equations are compiled separately for each sample in a
+        batch by mapping over it.  If `vectorise` is set, they are instead
+        compiled once over the whole batch, with each node carrying a leading
+        batch dimension and derivatives being taken for every sample at once.
+
+        Unless `canonicalise` is turned off, structurally identical variables
+        are merged before compilation so that each distinct computation is
+        only compiled once.
+
+        Only the equations and any variables listed in `outputs` are exported
+        from the compiled graph; other variables stay internal to it, and are
+        compiled separately if they are asked for afterwards.
+
+        If a `GraphCache` is given, a graph compiled for the same system by an
+        earlier process is restored from it instead of being rebuilt.
+
+        If `sparse` is set (which requires `vectorise`), each group of
+        equations is only evaluated on the samples in which at least one of
+        them has a non-zero weight, and its residuals are zero elsewhere.  The
+        groups may be given as a list of lists of equations; by default every
+        equation involving a derivative is put in one group, and equations
+        outside of any group are evaluated on the whole batch.
+
+        `jit` records whether the graph is compiled within an XLA scope, which
+        marks its nodes for compilation, so that cached graphs are only reused
+        with the same setting.
+        """
+        if sparse and not vectorise:
+            raise ValueError("sparse evaluation requires a vectorised compiler")
+
         self.independent_variables = self.set_wrap(independent_variables)
         self.equations = self.set_wrap(equations)
+        self.vectorise = vectorise
+        self.canonicalise = canonicalise
+        self.outputs = self.set_wrap(outputs) if outputs is not None else set()
+        self.cache = cache
+        self.sparse = sparse
+        self.equation_groups = equation_groups
+        self.jit = jit
 
-        self.equation_weight_placeholders = {}
+        self.canonicaliser = None
 
-    def compile(self):
-        """Compile a tensorflow representation of the system's equations."""
-        independent_variable_placeholders = (
-            self.build_independent_variable_placeholders()
+    def compile(self, inputs=None, export_outputs=True):
+        """
+        Compile a tensorflow representation of the system's equations.
+
+        By default, placeholders are created for the independent variables and
+        equation weights.  Alternatively, `inputs` may give a tuple of two
+        dictionaries mapping independent variables and equations to existing
+        nodes, such as the outputs of an input pipeline, which are then used
+        in place of the placeholders.  Graphs built on given inputs are never
+        cached, as the inputs cannot be restored by another process.
+
+        Graphs which are only used to train the system, and never to fetch its
+        outputs, can leave them out by turning off `export_outputs`.
+        """
+        self.canonicaliser = self.build_canonicaliser()
+        cached = self.cache is not None and inputs is None
+        if cached:
+            compiled_graph = self.cache.load(self)
+            if compiled_graph is not None:
+                return compiled_graph
+
+        independent_variable_placeholders, equation_weight_placeholders = (
+            inputs
+            if inputs is not None
+            else (
+                self.build_independent_variable_placeholders(),
+                self.build_equation_weight_placeholders(),
+            )
         )
-        equation_weight_placeholders = self.build_equation_weight_placeholders()
 
-        equation_nodes, all_nodes = tf.map_fn(
-            self.map_inputs,
-            (independent_variable_placeholders, equation_weight_placeholders),
-            dtype=self.get_mapped_type(),
+        inputs = (independent_variable_placeholders, equation_weight_placeholders)
+        compilation_data = (
+            CompilationData(
+                independent_variable_placeholders,
+                batched=True,
+                canonicaliser=self.canonicaliser,
+            )
+            if self.vectorise
+            else None
         )
+        outputs = self.outputs if export_outputs else set()
+        if self.vectorise:
+            equation_nodes, all_nodes = self.batch_inputs(
+                inputs, compilation_data, outputs
+            )
+        else:
+            parameters = self.read_parameters()
+            equation_nodes, all_nodes = tf.map_fn(
+                lambda inputs: self.map_inputs(inputs, parameters, outputs),
+                inputs,
+                dtype=self.get_mapped_type(outputs),
+            )
         equation_nodes["batch_mean"] = tf.reduce_mean(equation_nodes["mean"])
         equation_nodes["weights"] = equation_weight_placeholders
-        return CompiledGraph(
-            self, independent_variable_placeholders, equation_nodes, all_nodes
+        compiled_graph = CompiledGraph(
+            self,
+            independent_variable_placeholders,
+            equation_nodes,
+            all_nodes,
+            compilation_data=compilation_data,
         )
 
-    def map_inputs(self, inputs):
+        if cached:
+            self.cache.save(self, compiled_graph)
+        return compiled_graph
+
+    def map_inputs(self, inputs, parameters=None, outputs=None):
         """Compile one set of the system's equations."""
         independent_variable_placeholders, equation_weight_placeholders = inputs
-        compilation_data = CompilationData(independent_variable_placeholders)
+        compilation_data = CompilationData(
+            independent_variable_placeholders,
+            canonicaliser=self.canonicaliser,
+            parameters=parameters,
+        )
         equation_nodes = self.compile_equations(
             compilation_data, equation_weight_placeholders
         )
 
-        return equation_nodes, compilation_data.export_all()
+        return equation_nodes, compilation_data.export(
+            self.outputs if outputs is None else outputs
+        )
+
+    def batch_inputs(self, inputs, compilation_data, outputs=None):
+        """Compile the system's equations once over a whole batch."""
+        _, equation_weight_placeholders = inputs
+        equation_nodes = self.compile_equations(
+            compilation_data, equation_weight_placeholders
+        )
+
+        return equation_nodes, compilation_data.export(
+            self.outputs if outputs is None else outputs
+        )
+
+    def compile_outputs(
+        self, independent_variable_placeholders, variables, compilation_data=None
+    ):
+        """
+        Compile nodes for variables which were not exported by the main graph.
+
+        When vectorised, these are added to the given batch compilation so
+        that any nodes they share with it are reused.  Otherwise a separate
+        map over the batch is built that exports only the given variables,
+        which recomputes everything they depend on; variables needed on every
+        step should instead be added to the main graph's outputs (see
+        `System.add_outputs`).
+        """
+        if self.vectorise:
+            compilation_data = compilation_data or CompilationData(
+                independent_variable_placeholders,
+                batched=True,
+                canonicaliser=self.canonicaliser,
+            )
+            return compilation_data.export(variables)
+
+        return self.map_outputs(independent_variable_placeholders, variables)
+
+    def map_outputs(self, placeholders, variables):
+        """Build a map over the batch which exports only the given variables."""
+        return tf.map_fn(
+            lambda placeholders: CompilationData(
+                placeholders, canonicaliser=self.canonicaliser
+            ).export(variables),
+            placeholders,
+            dtype={variable: tf.float32 for variable in variables},
+        )
+
+    def compile_inference(self, variables, arguments):
+        """
+        Compile a lean graph that calculates variables from their arguments.
+
+        The graph has no equations or equation weights, and shares its network
+        weights with the training graph.  It is compiled over whole batches
+        whether or not the compiler is vectorised, as it is never mapped over
+        samples, so wrapped operations which are not elementwise need a
+        batched variant (see `wrap_tf_function`).  Variables without
+        arguments are calculated once, as a batch of one.
+        """
+        if self.canonicaliser is None:
+            self.canonicaliser = self.build_canonicaliser()
+
+        variables = self.set_wrap(variables)
+        placeholders = {
+            argument: self.make_placeholder(argument.shape) for argument in arguments
+        }
+        if len(placeholders) == 0:
+            compilation_data = CompilationData(canonicaliser=self.canonicaliser)
+            outputs = {
+                variable: tf.expand_dims(node, axis=0)
+                for variable, node in compilation_data.export(variables).items()
+            }
+        else:
+            compilation_data = CompilationData(
+                placeholders, batched=True, canonicaliser=self.canonicaliser
+            )
+            outputs = compilation_data.export(variables)
+        return InferenceGraph(placeholders, outputs)
 
     def compile_equations(self, compilation_data, equation_weight_placeholders):
         """Create weighted nodes for each equation but do not aggregate them."""
-        unweighted = {
-            equation: compilation_data.get(equation) for equation in self.equations
-        }
+        unweighted = (
+            self.compile_sparse_equations(
+                compilation_data, equation_weight_placeholders
+            )
+            if self.sparse and compilation_data.batched
+            else {
+                equation: compilation_data.get(equation) for equation in self.equations
+            }
+        )
         weighted = {
             equation: equation_weight_placeholders[equation] * unweighted[equation]
             for equation in self.equations
@@ -52,9 +238,80 @@ class Compiler:
             "unweighted": unweighted,
             "weights": equation_weight_placeholders,
             "weighted": weighted,
-            "mean": tf.reduce_mean(tf.stack(list(weighted.values()), axis=0)),
+            "mean": tf.reduce_mean(tf.stack(list(weighted.values()), axis=0), axis=0),
         }
 
+    def compile_sparse_equations(self, compilation_data, equation_weight_placeholders):
+        """
+        Compile each group of equations only for the samples that need it.
+
+        The samples in which any equation in a group has a non-zero weight are
+        gathered and the group is compiled over just those, with residuals
+        being scattered back into a batch-sized node that is zero elsewhere.
+        """
+        groups = self.get_equation_groups()
+        grouped = {equation for group in groups for equation in group}
+        unweighted = {
+            equation: compilation_data.get(equation)
+            for equation in self.equations - grouped
+        }
+
+        for group in groups:
+            active = tf.reduce_any(
+                tf.stack(
+                    [tf.not_equal(equation_weight_placeholders[e], 0.0) for e in group],
+                    axis=0,
+                ),
+                axis=0,
+            )
+            indices = tf.where(active)
+            group_data = CompilationData(
+                {
+                    variable: tf.gather_nd(placeholder, indices)
+                    for variable, placeholder in compilation_data.placeholders.items()
+                },
+                batched=True,
+                canonicaliser=self.canonicaliser,
+            )
+            for equation in group:
+                unweighted[equation] = tf.scatter_nd(
+                    indices,
+                    group_data.get(equation),
+                    tf.shape(active, out_type=tf.int64),
+                )
+
+        return unweighted
+
+    def get_equation_groups(self):
+        """Return the groups of equations which are evaluated sparsely."""
+        if self.equation_groups is not None:
+            return [self.set_wrap(group) for group in self.equation_groups]
+
+        differential = set()
+        for equation in self.equations:
+            structure = CompilationStructure()
+            structure.set_variable(equation)
+            if any(
+                getattr(variable, "is_differential", False)
+                for variable in structure.structure
+            ):
+                differential.add(equation)
+        return [differential] if len(differential) > 0 else []
+
+    def build_canonicaliser(self):
+        """Merge structurally identical variables throughout the system."""
+        if not self.canonicalise:
+            return None
+
+        canonicaliser = Canonicaliser()
+        for variable in self._get_all_nodes_structure():
+            canonicaliser.canonicalise(variable)
+        return canonicaliser
+
+    def canonicalisation_report(self):
+        """Summarise how many variables were merged during the last compilation."""
+        return self.canonicaliser.report() if self.canonicaliser is not None else None
+
     def build_independent_variable_placeholders(self):
         """Get placeholder tensors for each independent variable."""
         return {
@@ -65,9 +322,12 @@ class Compiler:
         """Get placeholder tensors for the weight of each equation."""
         return {equation: self.make_placeholder(()) for equation in self.equations}
 
-    def get_mapped_type(self):
+    def get_mapped_type(self, outputs=None):
         """Return the structure of the tensorflow graph upon compiled."""
-        return (self._get_equation_nodes_structure(), self._get_all_nodes_structure())
+        return (
+            self._get_equation_nodes_structure(),
+            self._get_outputs_structure(outputs),
+        )
 
     def _get_equation_nodes_structure(self):
         """Return the structure of the equation nodes index generated by compilation."""
@@ -79,8 +339,13 @@ class Compiler:
             "mean": tf.float32,
         }
 
+    def _get_outputs_structure(self, outputs=None):
+        """Return the structure of the exported outputs generated upon compilation."""
+        outputs = self.outputs if outputs is None else outputs
+        return {variable: tf.float32 for variable in outputs}
+
     def _get_all_nodes_structure(self):
-        """Return the structure of the node dump generated upon compilation."""
+        """Return the structure of every variable reachable from the equations."""
         structure = CompilationStructure()
         for variable in self.independent_variables:
             structure.set_variable(variable)
@@ -88,6 +353,36 @@ class Compiler:
             structure.set_variable(equation)
         return structure.structure
 
+    def get_parameters(self):
+        """Return the network weights of every variable reachable from the equations."""
+        return [
+            parameter
+            for variable in self._get_networks()
+            for parameter in variable.parameters
+        ]
+
+    def read_parameters(self):
+        """
+        Read the network weights of every variable reachable from the equations.
+
+        The weights are read once outside of a map over the batch, so that its
+        loop only captures their values rather than reading them on each step,
+        which would make its gradients keep a copy of the weights for every
+        sample, on whichever device holds them.
+        """
+        return {
+            variable: [parameter.read_value() for parameter in variable.parameters]
+            for variable in self._get_networks()
+        }
+
+    def _get_networks(self):
+        """Return the variables reachable from the equations with network weights."""
+        return sorted(
+            variable
+            for variable in self._get_all_nodes_structure()
+            if isinstance(variable, Variable) and hasattr(variable, "parameters")
+        )
+
     def make_placeholder(self, shape, data_type=tf.float32):
         """Make a placeholder node of the given shape."""
         return tf.placeholder(data_type, shape=(None,) + shape)
@@ -104,44 +399,165 @@ class Compiler:
         else:
             return {values}
 
-    @staticmethod
-    def join_dictionaries(a, b):
-        """Merge the values of two dictionaries, prioritising those in the first."""
-        c = {k: v for k, v in b.items()}
-        for k, v in a.items():
-            c[k] = v
-        return c
-
 
 class CompilationData:
-    def __init__(self, placeholders={}):
-        """Create a data class for storing tensorflow nodes during compilation."""
+    def __init__(
+        self, placeholders={}, batched=False, canonicaliser=None, parameters=None
+    ):
+        """
+        Create a data class for storing tensorflow nodes during compilation.
+
+        If `batched` is set, every node is expected to have a leading batch
+        dimension, whose size is taken from the placeholders.  If a
+        canonicaliser is given, variables it considers equal share one node.
+        Variables with network weights use the nodes given for them in
+        `parameters`, if any, rather than reading the weights themselves.
+        """
+        self.placeholders = placeholders
+        self.parameters = parameters if parameters is not None else {}
         self.instances = {k: v for k, v in placeholders.items()}
         self.flattened_instances = {}
+        self.derivatives = {}
+        self.canonicaliser = canonicaliser
+
+        self.batched = batched
+        self.batch_size = (
+            tf.shape(next(iter(placeholders.values())))[0]
+            if batched and len(placeholders) > 0
+            else None
+        )
 
     def get(self, variable):
         """Retrieve the tensorflow node for the given variable."""
         if variable not in self.instances:
-            self.instances[variable] = (
-                variable.compile(self)
-                if isinstance(variable, Variable)
-                else Constant.wrap(variable).compile(self)
-            )
+            canonical = self.canonical(variable)
+            if canonical is not variable:
+                self.instances[variable] = self.get(canonical)
+            else:
+                self.instances[variable] = (
+                    variable.compile(self)
+                    if isinstance(variable, Variable)
+                    else Constant.wrap(variable).compile(self)
+                )
         return self.instances[variable]
 
+    def canonical(self, variable):
+        """Return the variable that compiles on behalf of those equal to this one."""
+        if self.canonicaliser is None:
+            return variable
+        return self.canonicaliser.canonicalise(variable)
+
+    def gradient(self, variable, with_respect_to, order=1):
+        """
+        Retrieve the node for a derivative of one variable against another.
+
+        Derivatives are memoised by variable, respective variable and order,
+        so each is built once per compilation no matter how many times it is
+        used, and higher orders are built on top of the lower ones.
+        """
+        if order == 0:
+            return self.get(variable)
+
+        variable = self.canonical(variable)
+        with_respect_to = self.canonical(with_respect_to)
+        key = (variable, with_respect_to, order)
+        if key not in self.derivatives:
+            self.derivatives[key] = jacobian(
+                self.gradient(variable, with_respect_to, order - 1),
+                self.get(with_respect_to),
+                shape_of(variable) + with_respect_to.shape * (order - 1),
+                with_respect_to.shape,
+                batched=self.batched,
+            )
+        return self.derivatives[key]
+
+    def gradients(self, variable, with_respect_to):
+        """
+        Retrieve the first derivatives of a variable against several others.
+
+        Any that have not already been memoised are built together, sharing
+        one gradient pass for each element of the variable.
+        """
+        variable = self.canonical(variable)
+        with_respect_to = [self.canonical(wrt) for wrt in with_respect_to]
+
+        missing = []
+        for wrt in with_respect_to:
+            if (variable, wrt, 1) not in self.derivatives and wrt not in missing:
+                missing.append(wrt)
+
+        if len(missing) > 0:
+            nodes = jacobians(
+                self.get(variable),
+                [self.get(wrt) for wrt in missing],
+                shape_of(variable),
+                [wrt.shape for wrt in missing],
+                batched=self.batched,
+            )
+            for wrt, node in zip(missing, nodes):
+                self.derivatives[(variable, wrt, 1)] = node
+
+        return [self.derivatives[(variable, wrt, 1)] for wrt in with_respect_to]
+
     def flatten(self, variable):
         """Retrieve a flattened version of the variable's tensorflow node."""
+        variable = self.canonical(variable)
         if variable not in self.flattened_instances:
-            self.flattened_instances[variable] = tf.reshape(self.get(variable), [-1])
+            self.flattened_instances[variable] = (
+                tf.reshape(self.get(variable), [-1, product(shape_of(variable))])
+                if self.batched
+                else tf.reshape(self.get(variable), [-1])
+            )
         return self.flattened_instances[variable]
 
     def join(self, variables):
         """Flatten each of the given variables and concatenate them."""
-        return tf.concat([self.flatten(variable) for variable in variables], axis=0)
+        return tf.concat([self.flatten(variable) for variable in variables], axis=-1)
 
-    def export_all(self):
-        """Return a complete dictionary of variables mapped to tensorflow tensors."""
-        return self.instances
+    def reshape(self, node, shape):
+        """Reshape a node, keeping its batch dimension if there is one."""
+        return tf.reshape(node, ([-1] if self.batched else []) + list(shape))
+
+    def align(self, nodes, variables):
+        """
+        Line up nodes of different ranks for an elementwise operation.
+
+        Broadcasting matches trailing axes, so with a batch dimension, nodes of
+        lower rank are given unit axes after it, just as each sample would be
+        broadcast on its own.
+        """
+        if not self.batched:
+            return nodes
+        rank = max(len(shape_of(variable)) for variable in variables)
+        aligned = []
+        for node, variable in zip(nodes, variables):
+            for _ in range(rank - len(shape_of(variable))):
+                node = tf.expand_dims(node, axis=1)
+            aligned.append(node)
+        return aligned
+
+    def broadcast(self, node):
+        """Repeat a node that is the same for every sample across the batch."""
+        if not self.batched:
+            return node
+        rank = node.shape.ndims
+        return tf.tile(tf.expand_dims(node, axis=0), [self.batch_size] + [1] * rank)
+
+    def index(self, node, index):
+        """Index a node, skipping over the batch dimension if there is one."""
+        if not self.batched:
+            return node[index]
+        return node[(slice(None),) + (index if isinstance(index, tuple) else (index,))]
+
+    def reduce_mean(self, node):
+        """Take the mean of a node over all of its non-batch dimensions."""
+        if not self.batched:
+            return tf.reduce_mean(node)
+        return tf.reduce_mean(node, axis=list(range(1, node.shape.ndims)))
+
+    def export(self, variables):
+        """Return a dictionary mapping each of the given variables to its node."""
+        return {variable: self.get(variable) for variable in variables}
 
 
 class CompilationStructure:
@@ -168,18 +584,57 @@ class CompilationStructure:
         return variable in self.structure
 
 
+class Canonicaliser:
+    def __init__(self):
+        """Create a data class for merging structurally identical variables."""
+        self.canonical_variables = {}
+        self.representatives = {}
+
+    def canonicalise(self, variable):
+        """
+        Return the representative of all variables equal to the one given.
+
+        Two variables are equal if they have the same canonical key, which for
+        most variables is built from the canonical forms of their arguments.
+        The first variable seen with each key becomes its representative.
+        """
+        if variable not in self.canonical_variables:
+            key = (
+                variable.canonical_key(self)
+                if isinstance(variable, Variable)
+                else Constant.value_key(variable)
+            )
+            if key not in self.representatives:
+                self.representatives[key] = variable
+            self.canonical_variables[variable] = self.representatives[key]
+        return self.canonical_variables[variable]
+
+    def report(self):
+        """Return the number of variables seen, kept distinct, and merged."""
+        variables = len(self.canonical_variables)
+        distinct = len(self.representatives)
+        return {
+            "variables": variables,
+            "distinct": distinct,
+            "merged": variables - distinct,
+        }
+
+
 class CompiledGraph:
-    def __init__(self, compiler, variable_nodes, equation_nodes, all_nodes):
+    def __init__(
+        self, compiler, variable_nodes, equation_nodes, all_nodes, compilation_data=None
+    ):
         """Create an object for easily accessing compiled nodes."""
         self.compiler = compiler
         self.variable_nodes = variable_nodes
         self.equation_nodes = equation_nodes
         self.all_nodes = all_nodes
+        self.compilation_data = compilation_data
 
     def get_inputs(self, variables):
         """
         For each variable given, return the corresponding input node.
-        
+
         If the variable is an independent variable, its placeholder will be
         returned.  If it is an equation, its weight placeholder will be
         returned.  Otherwise, an error will be thrown.
@@ -212,10 +667,22 @@ class CompiledGraph:
             elif variable in self.variable_nodes:
                 return self.variable_nodes[variable]
             else:
-                return self.all_nodes[variable]
+                return self._get_compiled_output(variable)
 
         return _get_output
 
+    def _get_compiled_output(self, variable):
+        """Retrieve an exported node, compiling it if it was not requested upfront."""
+        if variable not in self.all_nodes:
+            self.all_nodes.update(
+                self.compiler.compile_outputs(
+                    self.variable_nodes,
+                    [variable],
+                    compilation_data=self.compilation_data,
+                )
+            )
+        return self.all_nodes[variable]
+
     def get_mean_errors(self):
         """Return the node for mean weighted error for each sample in a batch."""
         return self.equation_nodes["mean"]
@@ -232,6 +699,29 @@ class CompiledGraph:
         )
 
 
+class InferenceGraph:
+    def __init__(self, input_nodes, output_nodes):
+        """Create an object for calculating variables outside of training."""
+        self.input_nodes = input_nodes
+        self.output_nodes = output_nodes
+
+    def run(self, session, queries, feed_dict={}):
+        """Calculate the queried variables given values for their arguments."""
+        return session.run(
+            nested_map(lambda variable: self.output_nodes[variable], queries),
+            feed_dict={self.input_nodes[k]: v for k, v in feed_dict.items()},
+        )
+
+
+def shape_of(variable):
+    """Return the shape of a variable, or of the constant it would be wrapped as."""
+    return (
+        variable.shape
+        if isinstance(variable, Variable)
+        else Constant.numpy_wrap(variable).shape
+    )
+
+
 def nested_map(f, data, map_values=True, map_keys=False):
     """Map over a data structure, keeping form while changing root values."""
     recall = lambda x: nested_map(f, x, map_keys=map_keys, map_values=map_values)
@@ -23,13 +23,23 @@ class Constant(Variable):
 
     def compile(self, compilation_data):
         """Compile a tensorflow node for the variable using the given compiler."""
-        return tf.constant(self.wrapped_value)
+        return compilation_data.broadcast(tf.constant(self.wrapped_value))
 
     def add_compiled_structure(self, structure):
         """Add the compiled structure of the variable to a structure dictionary."""
         if self not in structure:
             structure.add_key(self, tf.float32)
 
+    def canonical_key(self, canonicaliser):
+        """Return a key that is shared by all constants with the same value."""
+        return Constant.value_key(self.value)
+
+    @staticmethod
+    def value_key(value):
+        """Return the canonical key of a constant with the given value."""
+        wrapped_value = Constant.numpy_wrap(value)
+        return (Constant, wrapped_value.shape, wrapped_value.tobytes())
+
     @staticmethod
     def wrap(value):
         """Wrap the value in a constant variable if it is not already a variable."""
@@ -9,6 +9,9 @@ class Variable:
 
     variable_id = 0
 
+    # Whether the variable is calculated by differentiating another
+    is_differential = False
+
     def __init__(
         self, shape, intrinsic_dimension=None, is_independent=False, is_equation=False
     ):
@@ -51,6 +54,16 @@ class Variable:
             for argument in self.arguments:
                 structure.set_variable(argument)
 
+    def canonical_key(self, canonicaliser):
+        """
+        Return a key that is shared by all variables which compute the same value.
+
+        By default a variable is only equal to itself.  Variables that are pure
+        functions of their arguments should build their key from the canonical
+        forms of those arguments, so that equal sub-expressions are merged.
+        """
+        return self
+
     @property
     def represented_dimension(self):
         """Calculate the intrinsic dimension of the variable."""
@@ -139,7 +152,15 @@ class DependentVariable(Variable):
 
     def compile(self, compilation_data):
         """Compile a tensorflow node for the variable using the given compiler."""
-        return self.apply_to(compilation_data.join(self.arguments))
+        return self.apply_to(
+            compilation_data.join(self.arguments),
+            compilation_data.parameters.get(self),
+        )
+
+    @property
+    def parameters(self):
+        """Return a list of the trainable tensorflow variables of the network."""
+        return self.apply_to.parameters
 
 
 class IndexedVariable(Variable):
@@ -160,7 +181,21 @@ class IndexedVariable(Variable):
 
     def compile(self, compilation_data):
         """Compile a tensorflow node for the variable using the given compiler."""
-        return compilation_data.get(self.target)[self.index]
+        return compilation_data.index(compilation_data.get(self.target), self.index)
+
+    def add_compiled_structure(self, structure):
+        """Add the compiled structure of the variable to a structure dictionary."""
+        if self not in structure:
+            structure.add_key(self, tf.float32)
+            structure.set_variable(self.target)
+
+    def canonical_key(self, canonicaliser):
+        """Return a key that is shared by all variables which compute the same value."""
+        return (
+            IndexedVariable,
+            canonicaliser.canonicalise(self.target),
+            hashable_index(self.index),
+        )
 
 
 def product(values):
@@ -171,6 +206,16 @@ def product(values):
     return total
 
 
+def hashable_index(index):
+    """Convert an index, which may contain slices, into a hashable value."""
+    if isinstance(index, slice):
+        return (slice, index.start, index.stop, index.step)
+    elif isinstance(index, tuple):
+        return tuple(hashable_index(i) for i in index)
+    else:
+        return index
+
+
 def list_wrap(value):
     """Wrap the value in a list if it is not already a list."""
     return value if isinstance(value, list) else [value]
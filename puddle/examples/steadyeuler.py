@@ -1,4 +1,5 @@
-from random import uniform
+from numpy.random import uniform
+import numpy as np
 import puddle.puddle as pd
 
 
@@ -10,15 +11,15 @@ back_pressure = 0.0001
 
 
 def parameterise_surface(t):
-    """Return a point on the surface parameterised by t."""
+    """Return points on the surface parameterised by an array of t."""
 
     # A vertical wall in the middle of the flow
-    return 0.5, 0.25 + 0.5 * t
+    return np.full_like(t, 0.5), 0.25 + 0.5 * t
 
 
-def wrap_parameterised_surface():
-    """Wrap a sample from the surface in the appropriate feed dict."""
-    t = uniform(0, 1)
+def wrap_parameterised_surface(size):
+    """Wrap a batch of samples from the surface in the appropriate feed dict."""
+    t = uniform(0, 1, size)
     _x, _y = parameterise_surface(t)
     return {x: _x, y: _y}
 
@@ -60,40 +61,42 @@ downstream_boundary_condition = pd.equate(p, pd.constant(back_pressure))
 trainer = pd.trainer()
 trainer.add_sampler(pd.sampler.space([x, y], equations))
 trainer.add_sampler(
-    pd.sampler.anonymous(
+    pd.sampler.box_boundary(
         [x, y],
-        equations + upstream_boundary_conditions,
-        lambda: {x: x.lower, y: uniform(y.lower, y.upper)},
-        lambda: {
-            equations[0]: 0.0,
-            equations[1]: 0.0,
-            equations[2]: 0.0,
-            upstream_boundary_conditions[0]: 0.5,
-            upstream_boundary_conditions[1]: 0.5,
+        {
+            (x, "lower"): {
+                upstream_boundary_conditions[0]: 0.5,
+                upstream_boundary_conditions[1]: 0.5,
+            },
+            (x, "upper"): {downstream_boundary_condition: 1.0},
+            (y, "lower"): {
+                equations[0]: 0.2,
+                equations[1]: 0.2,
+                equations[2]: 0.2,
+                side_boundary_condition: 0.4,
+            },
+            (y, "upper"): {
+                equations[0]: 0.2,
+                equations[1]: 0.2,
+                equations[2]: 0.2,
+                side_boundary_condition: 0.4,
+            },
         },
-    ),
-    weight=0.1,
-)
-trainer.add_sampler(
-    pd.sampler.anonymous(
-        [x, y],
-        equations + [downstream_boundary_condition],
-        lambda: {x: x.upper, y: uniform(y.lower, y.upper)},
-        lambda: {
-            equations[0]: 0.0,
-            equations[1]: 0.0,
-            equations[2]: 0.0,
-            downstream_boundary_condition: 1.0,
+        weights={
+            (x, "lower"): 1.0,
+            (x, "upper"): 1.0,
+            (y, "lower"): 0.5,
+            (y, "upper"): 0.5,
         },
     ),
-    weight=0.1,
+    weight=0.3,
 )
 trainer.add_sampler(
-    pd.sampler.anonymous(
+    pd.sampler.anonymous_batched(
         [x, y],
         equations + no_slip_conditions,
         wrap_parameterised_surface,
-        lambda: {
+        lambda size: {
             equations[0]: 0.1,
             equations[1]: 0.1,
             equations[2]: 0.1,
@@ -103,20 +106,3 @@ trainer.add_sampler(
     ),
     weight=1.0,
 )
-trainer.add_sampler(
-    pd.sampler.anonymous(
-        [x, y],
-        equations + [side_boundary_condition],
-        lambda: {
-            x: uniform(x.lower, x.upper),
-            y: y.lower if uniform(0.0, 1.0) < 0.5 else y.upper,
-        },
-        lambda: {
-            equations[0]: 0.2,
-            equations[1]: 0.2,
-            equations[2]: 0.2,
-            side_boundary_condition: 0.4,
-        },
-    ),
-    weight=0.1,
-)
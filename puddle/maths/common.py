@@ -1,19 +1,40 @@
 from puddle.maths.wrapper import wrap_tf_function, ShapeFunctions
 import tensorflow as tf
+import functools
 
 
 copy = ShapeFunctions.copy_first_shape
+broadcast = ShapeFunctions.broadcast_shapes
 
-add = wrap_tf_function(tf.add, copy)
-subtract = wrap_tf_function(tf.subtract, copy)
-multiply = wrap_tf_function(tf.multiply, copy)
-divide = wrap_tf_function(tf.divide, copy)
+add = wrap_tf_function(tf.add, broadcast)
+subtract = wrap_tf_function(tf.subtract, broadcast)
+multiply = wrap_tf_function(tf.multiply, broadcast)
+divide = wrap_tf_function(tf.divide, broadcast)
 
 square = wrap_tf_function(tf.square, copy)
 sqrt = wrap_tf_function(tf.sqrt, copy)
 exp = wrap_tf_function(tf.exp, copy)
 
-stack = wrap_tf_function(tf.stack, ShapeFunctions.stack_shapes)
+
 dot = wrap_tf_function(
-    lambda a, b: tf.reduce_sum(tf.multiply(a, b)), ShapeFunctions.scalar
+    lambda a, b: tf.reduce_sum(tf.multiply(a, b)),
+    ShapeFunctions.scalar,
+    batched_function=lambda a, b: tf.reduce_sum(
+        tf.multiply(a, b), axis=list(range(1, a.shape.ndims))
+    ),
 )
+
+
+def stack(*variables, axis=0):
+    """Stack variables of the same shape along a new axis."""
+    return _stack_along(axis % (len(variables[0].shape) + 1))(*variables)
+
+
+@functools.lru_cache(maxsize=None)
+def _stack_along(axis):
+    """Wrap stacking along one axis, so equal stacks can be merged."""
+    return wrap_tf_function(
+        lambda *values: tf.stack(values, axis=axis),
+        lambda *args: ShapeFunctions.stack_shapes(*args, axis=axis),
+        batched_function=lambda *values: tf.stack(values, axis=axis + 1),
+    )
@@ -1,12 +1,23 @@
-from puddle.construction.variable import Variable
-from puddle.util.tensors import tensor_map
+from puddle.construction.variable import Variable, list_wrap
+from puddle.construction.space import Space
 import tensorflow as tf
 
 
 class Derivative(Variable):
+
+    is_differential = True
+
     def __init__(self, variable, with_respect_to, times=1):
-        """Represent the derivative of one variable with respect to another."""
-        super().__init__(variable.shape + with_respect_to.shape)
+        """
+        Represent the derivative of one variable with respect to another.
+
+        Higher-order derivatives are taken by setting `times`, in which case
+        the shape of the respective variable is appended once for each order.
+        """
+        if times < 1:
+            raise ValueError("derivatives must be taken at least once")
+
+        super().__init__(variable.shape + with_respect_to.shape * times)
 
         self.variable = variable
         self.with_respect_to = with_respect_to
@@ -14,11 +25,13 @@ class Derivative(Variable):
 
     def compile(self, compilation_data):
         """Compile a tensorflow node for the variable using the given compiler."""
-        variable = compilation_data.get(self.variable)
-        wrt = compilation_data.get(self.with_respect_to)
-        return tensor_map(
-            lambda v: tf.gradients(v, wrt)[0], variable, self.variable.shape
-        )
+        variable, times = self.variable, self.times
+        while (
+            isinstance(variable, Derivative)
+            and variable.with_respect_to is self.with_respect_to
+        ):
+            variable, times = variable.variable, times + variable.times
+        return compilation_data.gradient(variable, self.with_respect_to, times)
 
     def add_compiled_structure(self, structure):
         """Add the compiled structure of the variable to a structure dictionary."""
@@ -27,6 +40,121 @@ class Derivative(Variable):
             structure.set_variable(self.variable)
             structure.set_variable(self.with_respect_to)
 
+    def canonical_key(self, canonicaliser):
+        """Return a key that is shared by all variables which compute the same value."""
+        return (
+            Derivative,
+            canonicaliser.canonicalise(self.variable),
+            canonicaliser.canonicalise(self.with_respect_to),
+            self.times,
+        )
+
+
+class VectorDerivative(Variable):
+
+    is_differential = True
+
+    def __init__(self, variable, spaces, shape):
+        """Base class for vector calculus operators over a list of spaces."""
+        super().__init__(shape)
+
+        self.variable = variable
+        self.spaces = list_wrap(spaces)
+
+        if not all([isinstance(space, Space) for space in self.spaces]):
+            raise ValueError("derivatives can only be taken with respect to spaces")
+
+    @property
+    def dimensions(self):
+        """Return the total number of dimensions spanned by the spaces."""
+        return sum([space.represented_dimension for space in self.spaces])
+
+    def compile_partials(self, compilation_data):
+        """
+        Compile the first derivatives against each space from one shared pass.
+
+        The derivatives are flattened over the dimensions of each space and
+        concatenated, giving a node of shape `variable.shape + (dimensions,)`.
+        """
+        partials = compilation_data.gradients(self.variable, self.spaces)
+        return tf.concat(
+            [
+                compilation_data.reshape(
+                    partial, self.variable.shape + (space.represented_dimension,)
+                )
+                for partial, space in zip(partials, self.spaces)
+            ],
+            axis=-1,
+        )
+
+    def add_compiled_structure(self, structure):
+        """Add the compiled structure of the variable to a structure dictionary."""
+        if self not in structure:
+            structure.add_key(self, tf.float32)
+            structure.set_variable(self.variable)
+            for space in self.spaces:
+                structure.set_variable(space)
+
+    def canonical_key(self, canonicaliser):
+        """Return a key that is shared by all variables which compute the same value."""
+        return (
+            type(self),
+            canonicaliser.canonicalise(self.variable),
+            tuple(canonicaliser.canonicalise(space) for space in self.spaces),
+        )
+
+
+class Gradient(VectorDerivative):
+    def __init__(self, variable, spaces):
+        """Represent the gradient of a variable over one or more spaces."""
+        spaces = list_wrap(spaces)
+        super().__init__(
+            variable,
+            spaces,
+            variable.shape + (sum([s.represented_dimension for s in spaces]),),
+        )
+
+    def compile(self, compilation_data):
+        """Compile a tensorflow node for the variable using the given compiler."""
+        return self.compile_partials(compilation_data)
+
+
+class Divergence(VectorDerivative):
+    def __init__(self, variable, spaces):
+        """Represent the divergence of a vector variable over one or more spaces."""
+        super().__init__(variable, spaces, ())
+
+        if variable.shape != (self.dimensions,):
+            raise ValueError(
+                "variable must be a vector with one element for each dimension"
+            )
+
+    def compile(self, compilation_data):
+        """Compile a tensorflow node for the variable using the given compiler."""
+        return tf.linalg.trace(self.compile_partials(compilation_data))
+
+
+class Laplacian(VectorDerivative):
+    def __init__(self, variable, spaces):
+        """Represent the Laplacian of a variable over one or more spaces."""
+        super().__init__(variable, spaces, variable.shape)
+
+    def compile(self, compilation_data):
+        """Compile a tensorflow node for the variable using the given compiler."""
+        compilation_data.gradients(self.variable, self.spaces)
+        return tf.add_n(
+            [
+                tf.linalg.trace(
+                    compilation_data.reshape(
+                        compilation_data.gradient(self.variable, space, 2),
+                        self.variable.shape
+                        + (space.represented_dimension, space.represented_dimension),
+                    )
+                )
+                for space in self.spaces
+            ]
+        )
+
 
 class DeprecatedDerivative(Variable):
     def __init__(self, variable, with_respect_to, times=1):
@@ -16,8 +16,12 @@ class Equation(Variable):
 
     def compile(self, compilation_data):
         """Compile a tensorflow node for the variable using the given compiler."""
-        difference = compilation_data.get(self.lhs) - compilation_data.get(self.rhs)
-        return tf.reduce_mean(tf.square(difference))
+        lhs, rhs = compilation_data.align(
+            [compilation_data.get(self.lhs), compilation_data.get(self.rhs)],
+            [self.lhs, self.rhs],
+        )
+        difference = lhs - rhs
+        return compilation_data.reduce_mean(tf.square(difference))
 
     def add_compiled_structure(self, structure):
         """Add the compiled structure of the variable to a structure dictionary."""
@@ -3,8 +3,15 @@ from puddle.construction.constant import Constant
 import tensorflow as tf
 
 
-def wrap_tf_function(tensorflow_function, shape_function):
-    """Wrap a tensorflow function to be used to transform variables."""
+def wrap_tf_function(tensorflow_function, shape_function, batched_function=None):
+    """
+    Wrap a tensorflow function to be used to transform variables.
+
+    Elementwise functions work the same whether or not their arguments have a
+    batch dimension, once arguments of lower rank are lined up after it.
+    Functions which do not should also provide a version that treats the
+    leading dimension of each argument as a batch dimension.
+    """
 
     def inner_wrap(*args, **kwargs):
         shape = shape_function(*args, **kwargs)
@@ -22,28 +29,60 @@ def wrap_tf_function(tensorflow_function, shape_function):
             mapped_dict_args = {
                 k: compilation_data.get(v) for k, v in wrapped_dict_args.items()
             }
-            return tensorflow_function(*mapped_list_args, **mapped_dict_args)
+            if compilation_data.batched and batched_function is not None:
+                return batched_function(*mapped_list_args, **mapped_dict_args)
+
+            keys = list(wrapped_dict_args)
+            aligned = compilation_data.align(
+                mapped_list_args + [mapped_dict_args[k] for k in keys],
+                wrapped_list_args + [wrapped_dict_args[k] for k in keys],
+            )
+            return tensorflow_function(
+                *aligned[: len(mapped_list_args)],
+                **dict(zip(keys, aligned[len(mapped_list_args) :])),
+            )
 
         return AnonymousVariable(
             build_function,
             shape,
             compile_function=compile_function,
             input_variables=all_variables,
+            operation=inner_wrap,
+            arguments=wrapped_list_args,
+            keyword_arguments=wrapped_dict_args,
         )
 
+    inner_wrap.__wrapped__ = tensorflow_function
     return inner_wrap
 
 
 class AnonymousVariable(Variable):
     def __init__(
-        self, build_function, shape, compile_function=None, input_variables=[]
+        self,
+        build_function,
+        shape,
+        compile_function=None,
+        input_variables=[],
+        operation=None,
+        arguments=[],
+        keyword_arguments={},
     ):
-        """Create an anonymous variable from its shape and build function."""
+        """
+        Create an anonymous variable from its shape and build function.
+
+        If the operation that produced the variable and its arguments are
+        given, the variable will be merged with any other applying the same
+        operation to the same arguments.
+        """
         super().__init__(shape)
         self.build_function = build_function
         self.compile_function = compile_function
         self.input_variables = input_variables
 
+        self.operation = operation
+        self.arguments = arguments
+        self.keyword_arguments = keyword_arguments
+
     def build(self, builder):
         """Build a tensorflow representation of the variable."""
         return self.build_function(self, builder)
@@ -59,6 +98,20 @@ class AnonymousVariable(Variable):
             for variable in self.input_variables:
                 structure.set_variable(variable)
 
+    def canonical_key(self, canonicaliser):
+        """Return a key that is shared by all variables which compute the same value."""
+        if self.operation is None:
+            return self
+        return (
+            self.operation,
+            self.shape,
+            tuple(canonicaliser.canonicalise(arg) for arg in self.arguments),
+            tuple(
+                (k, canonicaliser.canonicalise(v))
+                for k, v in sorted(self.keyword_arguments.items(), key=lambda kv: kv[0])
+            ),
+        )
+
 
 class ShapeFunctions:
     @staticmethod
@@ -66,6 +119,22 @@ class ShapeFunctions:
         """Copies the shape of the first variable."""
         return args[0].shape
 
+    @staticmethod
+    def broadcast_shapes(*args, **kwargs):
+        """Broadcasts the shapes of the unkeyed arguments against each other."""
+        shapes = [Constant.wrap(arg).shape for arg in args]
+        rank = max(len(shape) for shape in shapes)
+        padded = [(1,) * (rank - len(shape)) + tuple(shape) for shape in shapes]
+        broadcast = []
+        for dimensions in zip(*padded):
+            sizes = set(dimensions) - {1}
+            if len(sizes) > 1:
+                raise ValueError(
+                    "cannot broadcast shapes {}".format(", ".join(map(str, shapes)))
+                )
+            broadcast.append(sizes.pop() if len(sizes) > 0 else 1)
+        return tuple(broadcast)
+
     @staticmethod
     def stack_shapes(*args, **kwargs):
         """Stacks the shape of each of the unkeyed arguments."""
@@ -10,16 +10,19 @@ import puddle.maths.common as _common
 import puddle.maths.equation as _equation
 import puddle.api.sampler as _sampler
 import puddle.api.system as _system
+import puddle.api.cluster as _cluster
 import puddle.api.samplers.space as _space_sampler
 import puddle.api.samplers.composite as _composite_sampler
 import puddle.api.samplers.subspace as _subspace
 import puddle.api.samplers.merged as _merged
 import puddle.api.samplers.anonymous as _anonymous
+import puddle.api.samplers.adaptive as _adaptive
+import puddle.api.samplers.boundary as _boundary
 import puddle.api.trainer as _trainer
+import puddle.util.worker as _worker
 import puddle.visualisation.linegraph as _line_graph
 import puddle.visualisation.heatmap as _heat_map
 
-
 repository = _repository.PuddleRepository
 
 space = _space.Space
@@ -37,6 +40,9 @@ compiler = _compiler.Compiler
 compilation_data = _compiler.CompilationData
 
 derivative = _derivatives.Derivative
+grad = _derivatives.Gradient
+div = _derivatives.Divergence
+laplacian = _derivatives.Laplacian
 wrap_tf_function = _wrapper.wrap_tf_function
 shape_functions = _wrapper.ShapeFunctions
 
@@ -53,15 +59,22 @@ dot = _common.dot
 equate = _equation.Equation
 
 system = _system.System
+cluster = _cluster.Cluster
 sampler = _sampler.Sampler
 sampler.space = _space_sampler.SpaceSampler
 sampler.constrained = _space_sampler.ConstrainedSpaceSampler
+sampler.quasi_random = _space_sampler.QuasiRandomSpaceSampler
+sampler.quasi_random_constrained = _space_sampler.QuasiRandomConstrainedSampler
 sampler.composite = _composite_sampler.CompositeSampler
 sampler.hyperplane = _subspace.HyperplaneSampler
 sampler.merged = _merged.MergedSampler
 sampler.anonymous = _anonymous.AnonymousSampler
+sampler.anonymous_batched = _anonymous.BatchedAnonymousSampler
+sampler.adaptive = _adaptive.AdaptiveSampler
+sampler.box_boundary = _boundary.BoxBoundarySampler
 
 trainer = _trainer.Trainer
+main_thread_call = _worker.MainThreadCall
 
 line_graph = _line_graph.LineGraph
 heat_map = _heat_map.HeatMap
@@ -17,34 +17,64 @@ activations = {
 
 
 def glorot_weights(shape):
-    """Generate a Xavier-initialised weight set of the given shape."""
+    """
+    Generate a Xavier-initialised weight set of the given shape.
+
+    Resource variables are used so that every read sees the latest value,
+    including reads inside a graph loop which also updates the weights.
+    """
     initialiser = tf.contrib.layers.xavier_initializer()
-    return tf.Variable(initialiser(shape))
+    return tf.Variable(initialiser(shape), use_resource=True)
 
 
 def make_layer(input_shape, output_shape, activation):
-    """Create a function that applies a single network layer to an input."""
+    """
+    Create a function that applies a single network layer to an input.
+
+    The layer may be given nodes to use in place of its weights and biases,
+    such as values read from them beforehand.
+    """
     input_shape = (input_shape,) if isinstance(input_shape, int) else input_shape
     output_shape = (output_shape,) if isinstance(output_shape, int) else output_shape
 
     weights = glorot_weights(input_shape[::-1] + output_shape)
     biases = glorot_weights(output_shape)
 
-    def apply_layer(node):
+    def apply_layer(node, parameters=None):
+        layer_weights, layer_biases = (
+            parameters if parameters is not None else (weights, biases)
+        )
         return activations[activation](
-            tf.add(biases, tf.tensordot(node, weights, len(input_shape)))
+            tf.add(layer_biases, tf.tensordot(node, layer_weights, len(input_shape)))
         )
 
+    apply_layer.parameters = [weights, biases]
     return apply_layer
 
 
 def compose(*operations):
-    """Create a function that composes multiple layers."""
+    """
+    Create a function that composes multiple layers.
+
+    Any nodes given in place of the parameters are shared out between the
+    layers in order.
+    """
 
-    def apply(node):
+    def apply(node, parameters=None):
         current = node
+        remaining = list(parameters) if parameters is not None else None
         for operation in operations:
-            current = operation(current)
+            count = len(getattr(operation, "parameters", []))
+            if remaining is not None and count > 0:
+                current = operation(current, remaining[:count])
+                remaining = remaining[count:]
+            else:
+                current = operation(current)
         return current
 
+    apply.parameters = [
+        parameter
+        for operation in operations
+        for parameter in getattr(operation, "parameters", [])
+    ]
     return apply
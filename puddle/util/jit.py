@@ -0,0 +1,24 @@
+import contextlib
+import tensorflow as tf
+
+
+def jit_scope(enabled=True):
+    """
+    Return a scope in which any nodes created are compiled with XLA.
+
+    Marking nodes explicitly means they are compiled on the CPU backend as
+    well as on GPUs.  If `enabled` is false, the scope does nothing.
+    """
+    if not enabled:
+        return contextlib.nullcontext()
+    return tf.contrib.compiler.jit.experimental_jit_scope()
+
+
+def session_config(jit=False):
+    """Create a session configuration, turning on XLA clustering if requested."""
+    config = tf.ConfigProto()
+    if jit:
+        config.graph_options.optimizer_options.global_jit_level = (
+            tf.OptimizerOptions.ON_1
+        )
+    return config
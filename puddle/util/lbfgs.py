@@ -0,0 +1,83 @@
+import numpy as np
+
+
+def minimise(function, initial_point, iterations, memory=10, callback=None):
+    """
+    Minimise a function with the limited-memory BFGS algorithm.
+
+    The function should return its value and gradient at a point, where the
+    point and gradient are flat float64 arrays.  Each iteration takes a step
+    along the quasi-Newton direction estimated from the last `memory` steps,
+    backtracking until the value decreases sufficiently.  After each
+    iteration, `callback` is called with the new point and value.  The search
+    stops early if no step along the direction decreases the value.  Returns
+    the final point and its value.
+    """
+    point = initial_point
+    value, gradient = function(point)
+    steps, changes = [], []
+
+    for _ in range(iterations):
+        direction = -estimate_inverse_hessian_product(gradient, steps, changes)
+        slope = np.dot(gradient, direction)
+        if not slope < 0:
+            steps, changes = [], []
+            direction, slope = -gradient, -np.dot(gradient, gradient)
+
+        # Without any curvature information, limit the size of the first step
+        step_size = 1.0 if len(steps) > 0 else min(1.0, 1.0 / np.sum(np.abs(gradient)))
+        new_point, new_value, new_gradient = line_search(
+            function, point, value, direction, slope, step_size
+        )
+        if new_point is None:
+            break
+
+        step, change = new_point - point, new_gradient - gradient
+        if np.dot(step, change) > 1e-10:
+            steps.append(step)
+            changes.append(change)
+            if len(steps) > memory:
+                steps.pop(0)
+                changes.pop(0)
+
+        point, value, gradient = new_point, new_value, new_gradient
+        if callback is not None:
+            callback(point, value)
+
+    return point, value
+
+
+def line_search(function, point, value, direction, slope, step_size, shrink=0.5):
+    """
+    Backtrack along a direction until the Armijo condition is satisfied.
+
+    Returns the new point with its value and gradient, or three Nones if the
+    step becomes negligible before the value decreases sufficiently.
+    """
+    while step_size > 1e-10:
+        new_point = point + step_size * direction
+        new_value, new_gradient = function(new_point)
+        if new_value <= value + 1e-4 * step_size * slope:
+            return new_point, new_value, new_gradient
+        step_size *= shrink
+    return None, None, None
+
+
+def estimate_inverse_hessian_product(gradient, steps, changes):
+    """Estimate the product of the inverse Hessian and a gradient by two loops."""
+    product = gradient.copy()
+    coefficients = []
+    for step, change in reversed(list(zip(steps, changes))):
+        scale = 1.0 / np.dot(change, step)
+        coefficient = scale * np.dot(step, product)
+        product -= coefficient * change
+        coefficients.append((scale, coefficient))
+
+    if len(steps) > 0:
+        product *= np.dot(steps[-1], changes[-1]) / np.dot(changes[-1], changes[-1])
+
+    for (step, change), (scale, coefficient) in zip(
+        zip(steps, changes), reversed(coefficients)
+    ):
+        product += step * (coefficient - scale * np.dot(change, product))
+    return product
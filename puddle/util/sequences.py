@@ -0,0 +1,192 @@
+import numpy as np
+
+# Primitive polynomials and initial direction numbers for the Sobol sequence,
+# from Joe and Kuo's new-joe-kuo-6.21201 table, as (degree, coefficients, m).
+SOBOL_PARAMETERS = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]),
+    (6, 16, [1, 3, 1, 13, 27, 49]),
+]
+
+PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59, 61, 67, 71]
+
+
+class Sobol:
+
+    bits = 32
+
+    def __init__(self, dimensions, scramble=True, seed=None):
+        """
+        Generate points of the Sobol sequence in the unit hypercube.
+
+        Successive calls to `next` continue the sequence.  If `scramble` is
+        set, the sequence is randomised by a random linear matrix scramble and
+        a digital shift, which keep its low discrepancy while removing the
+        point at the origin and giving an unbiased estimate of integrals.
+        """
+        if dimensions > len(SOBOL_PARAMETERS) + 1:
+            raise ValueError(
+                "the Sobol sequence is only available in up to {} dimensions".format(
+                    len(SOBOL_PARAMETERS) + 1
+                )
+            )
+        self.dimensions = dimensions
+        self.index = 0
+
+        self.directions = self._get_directions()
+        self.shift = np.zeros(dimensions, dtype=np.uint64)
+        if scramble:
+            random = np.random.RandomState(seed)
+            self.directions = self._scramble_directions(random)
+            self.shift = random.randint(
+                0, 2**self.bits, size=dimensions, dtype=np.uint64
+            )
+
+    def _get_directions(self):
+        """Build the direction numbers of each dimension as integers."""
+        directions = np.zeros((self.dimensions, self.bits), dtype=np.uint64)
+        directions[0] = [1 << (self.bits - 1 - bit) for bit in range(self.bits)]
+
+        for dimension in range(1, self.dimensions):
+            degree, coefficients, initial = SOBOL_PARAMETERS[dimension - 1]
+            m = list(initial)
+            for k in range(degree, self.bits):
+                value = m[k - degree] ^ (m[k - degree] << degree)
+                for l in range(1, degree):
+                    if (coefficients >> (degree - 1 - l)) & 1:
+                        value ^= m[k - l] << l
+                m.append(value)
+            directions[dimension] = [
+                m[bit] << (self.bits - 1 - bit) for bit in range(self.bits)
+            ]
+        return directions
+
+    def _scramble_directions(self, random):
+        """Multiply the direction numbers by random lower triangular matrices."""
+        scrambled = np.zeros_like(self.directions)
+        for dimension in range(self.dimensions):
+            # Row i of the matrix maps output bit i, counting from the top bit
+            matrix = np.tril(random.randint(0, 2, size=(self.bits, self.bits)))
+            np.fill_diagonal(matrix, 1)
+            for bit in range(self.bits):
+                column = [
+                    (int(self.directions[dimension, bit]) >> (self.bits - 1 - row)) & 1
+                    for row in range(self.bits)
+                ]
+                rows = matrix.dot(column) % 2
+                scrambled[dimension, bit] = sum(
+                    int(value) << (self.bits - 1 - row)
+                    for row, value in enumerate(rows)
+                )
+        return scrambled
+
+    def next(self, count):
+        """Return the next points of the sequence as an array of shape (count, d)."""
+        indices = np.arange(self.index, self.index + count, dtype=np.uint64)
+        self.index += count
+        gray_codes = indices ^ (indices >> np.uint64(1))
+
+        points = np.tile(self.shift, (count, 1))
+        for bit in range(self.bits):
+            selected = ((gray_codes >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+            points[selected] ^= self.directions[:, bit]
+        return points.astype(np.float64) / 2.0**self.bits
+
+
+class Halton:
+    def __init__(self, dimensions, scramble=True, seed=None):
+        """
+        Generate points of the Halton sequence in the unit hypercube.
+
+        Successive calls to `next` continue the sequence.  If `scramble` is
+        set, the non-zero digits in each prime base are randomly permuted,
+        which breaks up the correlation between dimensions with large bases.
+        Since every permutation leaves zero in place, the sequence starts from
+        its second point to avoid sampling the origin.
+        """
+        if dimensions > len(PRIMES):
+            raise ValueError(
+                "the Halton sequence is only available in up to {} dimensions".format(
+                    len(PRIMES)
+                )
+            )
+        self.dimensions = dimensions
+        self.bases = PRIMES[:dimensions]
+        self.index = 1
+
+        random = np.random.RandomState(seed)
+        self.permutations = [
+            (
+                np.concatenate([[0], 1 + random.permutation(base - 1)])
+                if scramble
+                else np.arange(base)
+            )
+            for base in self.bases
+        ]
+
+    def next(self, count):
+        """Return the next points of the sequence as an array of shape (count, d)."""
+        indices = np.arange(self.index, self.index + count)
+        self.index += count
+        return np.stack(
+            [
+                self._radical_inverse(indices, base, permutation)
+                for base, permutation in zip(self.bases, self.permutations)
+            ],
+            axis=1,
+        )
+
+    @staticmethod
+    def _radical_inverse(indices, base, permutation):
+        """Reflect the permuted digits of each index about the decimal point."""
+        result = np.zeros(len(indices))
+        remaining = indices.copy()
+        scale = 1.0 / base
+        while np.any(remaining > 0):
+            result += permutation[remaining % base] * scale
+            remaining //= base
+            scale /= base
+        return result
+
+
+class LatinHypercube:
+    def __init__(self, dimensions, seed=None):
+        """
+        Generate Latin hypercube designs in the unit hypercube.
+
+        Each call to `next` returns a new design, in which the projection onto
+        every dimension has exactly one point in each of `count` equal strata.
+        """
+        self.dimensions = dimensions
+        self.random = np.random.RandomState(seed)
+
+    def next(self, count):
+        """Return a design of the given number of points, with shape (count, d)."""
+        strata = np.stack(
+            [self.random.permutation(count) for _ in range(self.dimensions)], axis=1
+        )
+        return (strata + self.random.uniform(size=(count, self.dimensions))) / count
+
+
+def make_sequence(name, dimensions, scramble=True, seed=None):
+    """Create a low-discrepancy sequence by name: "sobol", "halton" or "latin"."""
+    if name == "sobol":
+        return Sobol(dimensions, scramble=scramble, seed=seed)
+    elif name == "halton":
+        return Halton(dimensions, scramble=scramble, seed=seed)
+    elif name == "latin":
+        return LatinHypercube(dimensions, seed=seed)
+    else:
+        raise ValueError("unknown sequence '{}'".format(name))
@@ -1,13 +1,88 @@
+from puddle.construction.variable import product
 import tensorflow as tf
 
 
-def tensor_map(f, tensor, shape):
-    """Map the values of a tensor, maintaining its shape."""
-    if len(shape) == 0:
-        return f(tensor)
-    else:
-        remaining_shape = shape[1:]
-        subtensors = [
-            tensor_map(f, tensor[i], remaining_shape) for i in range(shape[0])
-        ]
-        return tf.stack(subtensors, axis=0)
+def jacobian(output, wrt, output_shape, wrt_shape, batched=False):
+    """
+    Calculate the derivative of every element of one tensor against another.
+
+    The result has shape `output_shape + wrt_shape`, preceded by the batch
+    dimension if `batched` is set.  Reverse accumulation needs one gradient
+    pass per element of the output and forward accumulation one per element
+    of the tensor being differentiated against, so whichever is smaller is
+    used.
+    """
+    output_size, wrt_size = product(output_shape), product(wrt_shape)
+    batch_shape = [-1] if batched else []
+    columns = (
+        _reverse_jacobian(output, wrt, output_size, batch_shape)
+        if output_size <= wrt_size
+        else _forward_jacobian(output, wrt, wrt_shape, wrt_size, batch_shape)
+    )
+    return tf.reshape(columns, batch_shape + list(output_shape) + list(wrt_shape))
+
+
+def _reverse_jacobian(output, wrt, output_size, batch_shape):
+    """Build a Jacobian with one gradient pass for each output element."""
+    flattened = tf.reshape(output, batch_shape + [output_size])
+    return tf.stack(
+        [gradient(flattened[..., i], wrt) for i in range(output_size)],
+        axis=len(batch_shape),
+    )
+
+
+def _forward_jacobian(output, wrt, wrt_shape, wrt_size, batch_shape):
+    """
+    Build a Jacobian with one gradient pass for each input element.
+
+    The vector-Jacobian product is linear in its cotangent, so differentiating
+    it with respect to that cotangent gives Jacobian-vector products.
+    """
+    cotangent = tf.zeros_like(output)
+    vector_jacobian_product = gradient(output, wrt, grad_ys=cotangent)
+    tangents = tf.reshape(tf.eye(wrt_size), [wrt_size] + list(wrt_shape))
+    return tf.stack(
+        [
+            gradient(
+                vector_jacobian_product,
+                cotangent,
+                grad_ys=tf.zeros_like(wrt) + tangents[i],
+            )
+            for i in range(wrt_size)
+        ],
+        axis=-1,
+    )
+
+
+def jacobians(output, wrts, output_shape, wrt_shapes, batched=False):
+    """
+    Calculate the derivatives of one tensor against each of several others.
+
+    Every element of the output is differentiated against all of the other
+    tensors in a single gradient pass, so adding more of them does not add
+    more passes.  Each result is shaped as it would be by `jacobian`.
+    """
+    output_size = product(output_shape)
+    batch_shape = [-1] if batched else []
+    flattened = tf.reshape(output, batch_shape + [output_size])
+    rows = [gradients(flattened[..., i], wrts) for i in range(output_size)]
+    return [
+        tf.reshape(
+            tf.stack([row[j] for row in rows], axis=len(batch_shape)),
+            batch_shape + list(output_shape) + list(wrt_shape),
+        )
+        for j, wrt_shape in enumerate(wrt_shapes)
+    ]
+
+
+def gradient(ys, xs, grad_ys=None):
+    """Differentiate a tensor, giving zeros where there is no dependence."""
+    return gradients(ys, [xs], grad_ys=grad_ys)[0]
+
+
+def gradients(ys, xs, grad_ys=None):
+    """Differentiate a tensor against several others in one pass."""
+    return [
+        derivative if derivative is not None else tf.zeros_like(x)
+        for derivative, x in zip(tf.gradients(ys, xs, grad_ys=grad_ys), xs)
+    ]
@@ -0,0 +1,91 @@
+import threading
+import queue
+
+
+class BackgroundWorker:
+    def __init__(self, process, queue_size=8, block=True):
+        """
+        Process items one at a time on a background thread.
+
+        Items wait in a queue holding at most `queue_size` items.  When it is
+        full, submitting an item either waits for space if `block` is set, or
+        drops the item otherwise.  Any error raised while processing is raised
+        again on the submitting thread by the next call to `submit` or `flush`.
+
+        If processing an item returns a function, such as one drawing a figure
+        that may only be touched from the main thread, it is called on the
+        submitting thread by the next call to `submit` or `flush`.
+        """
+        self.process = process
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.completions = queue.Queue()
+        self.block = block
+        self.dropped = 0
+        self.error = None
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        """Queue an item to be processed, blocking or dropping it when full."""
+        self._raise_error()
+        self._run_completions()
+        if self.block:
+            self.queue.put(item)
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+
+    def flush(self):
+        """Wait until every queued item has been processed."""
+        self.queue.join()
+        self._raise_error()
+        self._run_completions()
+
+    def _run(self):
+        """Process items from the queue until the program exits."""
+        while True:
+            item = self.queue.get()
+            try:
+                if self.error is None:
+                    completion = self.process(item)
+                    if completion is not None:
+                        self.completions.put(completion)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def _run_completions(self):
+        """Call the functions returned by processing so far on this thread."""
+        while True:
+            try:
+                completion = self.completions.get_nowait()
+            except queue.Empty:
+                return
+            completion()
+
+    def _raise_error(self):
+        """Raise any error from processing an item, clearing it once raised."""
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+class MainThreadCall:
+    def __init__(self, function):
+        """
+        Mark a function to be called on the main thread once a callback returns.
+
+        Post-batch callbacks return these for work which may only be done on
+        the main thread, such as drawing matplotlib figures, and the trainer
+        calls them there even when callbacks run in the background.  Any other
+        value returned by a callback is ignored.
+        """
+        self.function = function
+
+    def __call__(self):
+        """Call the marked function."""
+        return self.function()
@@ -1,5 +1,6 @@
 from puddle.construction.variable import Variable
 from puddle.construction.space import Space
+from puddle.util.worker import MainThreadCall
 from matplotlib import rc
 import matplotlib.pyplot as plt
 import numpy as np
@@ -64,10 +65,25 @@ class HeatMap:
 
     def update(self):
         """Update the rendered heat map."""
-        self.image.set_data(self._get_z_data())
+        self._draw(self._get_z_data())
+
+    def _draw(self, z_data):
+        """Redraw the heat map with the given data."""
+        self.image.set_data(z_data)
         self.figure.canvas.draw()
 
     def update_during_training(self, trainer, update_frequency):
-        """Update the graph every n epochs during training."""
+        """
+        Update the graph every n epochs during training.
+
+        The callback only calculates the data, and returns the drawing for the
+        trainer to do on the main thread, even if callbacks run in the
+        background.
+        """
         self.ready()
-        trainer.every(update_frequency, lambda _1, _2: self.update())
+
+        def calculate(_1, _2):
+            z_data = self._get_z_data()
+            return MainThreadCall(lambda: self._draw(z_data))
+
+        trainer.every(update_frequency, calculate)
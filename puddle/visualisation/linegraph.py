@@ -1,5 +1,6 @@
 from puddle.construction.space import Space, Scalar
 from puddle.construction.variable import Variable
+from puddle.util.worker import MainThreadCall
 from matplotlib import rc
 import numpy as np
 import matplotlib.pyplot as plt
@@ -70,10 +71,25 @@ class LineGraph:
 
     def update(self):
         """Update the data shown on the graph."""
-        self.line.set_ydata(self._get_y_data())
+        self._draw(self._get_y_data())
+
+    def _draw(self, y_data):
+        """Redraw the graph with the given data."""
+        self.line.set_ydata(y_data)
         self.figure.canvas.draw()
 
     def update_during_training(self, trainer, update_frequency):
-        """Update the graph every n epochs during training."""
+        """
+        Update the graph every n epochs during training.
+
+        The callback only calculates the data, and returns the drawing for the
+        trainer to do on the main thread, even if callbacks run in the
+        background.
+        """
         self.ready()
-        trainer.every(update_frequency, lambda _1, _2: self.update())
+
+        def calculate(_1, _2):
+            y_data = self._get_y_data()
+            return MainThreadCall(lambda: self._draw(y_data))
+
+        trainer.every(update_frequency, calculate)
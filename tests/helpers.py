@@ -0,0 +1,66 @@
+import puddle.puddle as pd
+import tensorflow as tf
+import numpy as np
+import unittest
+
+
+class SystemTestCase(unittest.TestCase):
+    def setUp(self):
+        """Start each test from an empty graph."""
+        tf.reset_default_graph()
+
+    def compile_systems(self, independent_variables, equations, configurations):
+        """
+        Compile the same system once for each set of options.
+
+        The options are passed to the system, apart from `canonicalise`, which
+        is set on its compiler.  The weights are initialised by the first
+        system and copied to the others, so that every system should calculate
+        the same values.
+        """
+        systems = []
+        for options in configurations:
+            options = dict(options)
+            canonicalise = options.pop("canonicalise", True)
+            system = pd.system(
+                independent_variables=independent_variables,
+                equations=equations,
+                **options
+            )
+            system.compiler.canonicalise = canonicalise
+            systems.append(system.compile())
+        parameters = systems[0].compiler.get_parameters()
+        values = systems[0].session.run(parameters)
+        for system in systems[1:]:
+            system.session.run(
+                [
+                    parameter.assign(value)
+                    for parameter, value in zip(parameters, values)
+                ]
+            )
+        return systems
+
+    def make_feed(self, independent_variables, equations, size, weights=None, seed=0):
+        """Draw values for the spaces within their bounds, weighting every equation."""
+        random = np.random.RandomState(seed)
+        feed = {
+            space: random.uniform(space.lower, space.upper, (size,) + space.shape)
+            for space in independent_variables
+        }
+        for equation in equations:
+            feed[equation] = weights[equation] if weights is not None else np.ones(size)
+        return feed
+
+    def assertSameValues(self, systems, queries, feed, tolerance=1e-5):
+        """Check that every system gives the same values for the queries."""
+        expected = systems[0].run(queries, feed)
+        for system in systems[1:]:
+            values = system.run(queries, feed)
+            for query, value, expected_value in zip(queries, values, expected):
+                np.testing.assert_allclose(
+                    value,
+                    expected_value,
+                    rtol=tolerance,
+                    atol=tolerance,
+                    err_msg="{} differs between systems".format(str(query)),
+                )
@@ -0,0 +1,37 @@
+from tests.helpers import SystemTestCase
+import puddle.puddle as pd
+import threading
+import unittest
+
+
+class CallbacksTest(SystemTestCase):
+    def test_main_thread_calls(self):
+        """Only values marked as main thread calls are called by the trainer."""
+        x = pd.scalar()
+        u = pd.dependent([x], [((4,), "tanh"), ((), "id")])
+        equations = [pd.equate(pd.derivative(u, x), 1.0)]
+        (system,) = self.compile_systems([x], equations, [{}])
+
+        for asynchronous in [False, True]:
+            called, threads = [], []
+
+            def unmarked(trainer, queries):
+                return lambda: called.append(None)
+
+            def marked(trainer, queries):
+                return pd.main_thread_call(
+                    lambda: threads.append(threading.current_thread())
+                )
+
+            trainer = pd.trainer(system=system, post_batch_callbacks=[unmarked, marked])
+            trainer.add_sampler(pd.sampler.space([x], equations))
+            if asynchronous:
+                trainer.use_asynchronous_callbacks()
+            trainer.train(3)
+
+            self.assertEqual(called, [])
+            self.assertEqual(threads, [threading.main_thread()] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+from tests.helpers import SystemTestCase
+import puddle.puddle as pd
+import tensorflow as tf
+import numpy as np
+import unittest
+
+
+class DerivativeTest(SystemTestCase):
+    def test_jacobian(self):
+        """Jacobians match a gradient taken separately for each element."""
+        v = pd.vector(3, -1.0, 1.0)
+        w = pd.dependent([v], [((8,), "tanh"), ((2,), "id")])
+        first, second = pd.derivative(w, v), pd.derivative(w, v, times=2)
+        system = pd.system(
+            independent_variables=[v], equations=[pd.equate(w)], vectorise=True
+        ).compile()
+
+        inputs = system.graph.get_inputs(v)
+        output = system.graph.get_outputs(w)
+        # Samples are independent, so summing over the batch gives each gradient
+        expected_first = tf.stack(
+            [tf.gradients(output[:, i], inputs)[0] for i in range(2)], axis=1
+        )
+        expected_second = tf.stack(
+            [
+                tf.stack(
+                    [
+                        tf.gradients(expected_first[:, i, j], inputs)[0]
+                        for j in range(3)
+                    ],
+                    axis=1,
+                )
+                for i in range(2)
+            ],
+            axis=1,
+        )
+
+        feed = self.make_feed([v], [], 4)
+        values = system.session.run(
+            [
+                system.graph.get_outputs(first),
+                system.graph.get_outputs(second),
+                expected_first,
+                expected_second,
+            ],
+            system.graph.get_inputs(feed),
+        )
+        self.assertEqual(values[0].shape, (4, 2, 3))
+        self.assertEqual(values[1].shape, (4, 2, 3, 3))
+        np.testing.assert_allclose(values[0], values[2], rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(values[1], values[3], rtol=1e-5, atol=1e-6)
+
+    def test_canonicalise(self):
+        """Merging equal variables keeps their values and compiles fewer nodes."""
+        x, y = pd.scalar(), pd.scalar()
+        u = pd.dependent([x, y], [((8,), "tanh"), ((), "id")])
+        equations = [
+            pd.equate(pd.laplacian(u, [x, y]), pd.multiply(u, u)),
+            pd.equate(pd.derivative(pd.derivative(u, x), x), pd.multiply(u, u)),
+            pd.equate(pd.add(pd.derivative(u, y), pd.derivative(u, y)), 1.0),
+        ]
+        feed = self.make_feed([x, y], equations, 5)
+
+        for vectorise in [False, True]:
+            configurations = [
+                {"vectorise": vectorise, "canonicalise": False},
+                {"vectorise": vectorise, "canonicalise": True},
+            ]
+            systems = self.compile_systems([x, y], equations, configurations)
+            self.assertSameValues(systems, equations, feed)
+
+            counts = []
+            for configuration in configurations:
+                before = len(tf.get_default_graph().get_operations())
+                self.compile_systems([x, y], equations, [configuration])
+                counts.append(len(tf.get_default_graph().get_operations()) - before)
+            self.assertLess(counts[1], counts[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+from tests.helpers import SystemTestCase
+import puddle.puddle as pd
+import tensorflow as tf
+import numpy as np
+import unittest
+
+
+class ExportTest(SystemTestCase):
+    def test_batched_inference(self):
+        """Exports of a mapped system run over whole batches with the same values."""
+        x, y = pd.scalar(), pd.scalar()
+        u = pd.dependent([x, y], [((8,), "tanh"), ((), "id")])
+        w = pd.dependent([x, y], [((8,), "tanh"), ((2,), "id")])
+        gradient = pd.grad(u, [x, y])
+        product = pd.multiply(w, u)
+        equations = [pd.equate(gradient, w), pd.equate(product, 1.0)]
+        (system,) = self.compile_systems([x, y], equations, [{"vectorise": False}])
+        system.add_outputs([gradient, product])
+
+        graph = tf.get_default_graph()
+        existing = set(graph.get_operations())
+        functions = [system.export(v, [x, y]) for v in [u, gradient, product]]
+        self.assertFalse(
+            any(op.type == "Enter" for op in set(graph.get_operations()) - existing)
+        )
+
+        feed = self.make_feed([x, y], equations, 5)
+        expected = system.run([u, gradient, product], feed)
+        for function, values in zip(functions, expected):
+            np.testing.assert_allclose(
+                function(feed[x], feed[y]), values, rtol=1e-5, atol=1e-5
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
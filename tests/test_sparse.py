@@ -0,0 +1,45 @@
+from tests.helpers import SystemTestCase
+import puddle.puddle as pd
+import numpy as np
+import unittest
+
+
+class SparseTest(SystemTestCase):
+    def test_matches_dense(self):
+        """Evaluating equations only where they are weighted leaves the loss alone."""
+        x, y = pd.scalar(), pd.scalar()
+        u = pd.dependent([x, y], [((8,), "tanh"), ((), "id")])
+        w = pd.dependent([x, y], [((8,), "tanh"), ((2,), "id")])
+        equations = [
+            pd.equate(pd.laplacian(u, [x, y]), 1.0),
+            pd.equate(pd.grad(u, [x, y]), w),
+            pd.equate(w, 1.0),
+            pd.equate(u, 0.0),
+        ]
+        systems = self.compile_systems(
+            [x, y],
+            equations,
+            [{"vectorise": True}, {"vectorise": True, "sparse": True}],
+        )
+
+        size = 6
+        random = np.random.RandomState(1)
+        weights = {
+            equation: random.choice([0.0, 0.5, 1.0], size) for equation in equations
+        }
+        # Leave one equation without any weighted samples
+        weights[equations[1]] = np.zeros(size)
+        feed = self.make_feed([x, y], equations, size, weights=weights)
+
+        self.assertSameValues(systems, equations, feed)
+        dense, sparse = [
+            system.session.run(
+                system.graph.get_mean_errors(), system.graph.get_inputs(feed)
+            )
+            for system in systems
+        ]
+        np.testing.assert_allclose(sparse, dense, rtol=1e-5, atol=1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+from tests.helpers import SystemTestCase
+import puddle.puddle as pd
+import numpy as np
+import unittest
+
+
+class TowersTest(SystemTestCase):
+    def test_error(self):
+        """The towers' error is the mean error of the whole batch."""
+        x, y = pd.scalar(), pd.scalar()
+        u = pd.dependent([x, y], [((8,), "tanh"), ((), "id")])
+        equations = [pd.equate(pd.laplacian(u, [x, y]), 1.0), pd.equate(u, 0.0)]
+        (system,) = self.compile_systems([x, y], equations, [{}])
+
+        trainer = pd.trainer(system=system, post_batch_callbacks=[])
+        trainer.add_query("error")
+        trainer.use_towers(3)
+        self.assertIs(trainer.queries["error"], trainer.error)
+
+        # The batch does not split evenly between the towers
+        feed = system.graph.get_inputs(self.make_feed([x, y], equations, 5))
+        towers, untowered = system.session.run(
+            (trainer.error, system.graph.get_batch_mean_error()), feed
+        )
+        np.testing.assert_allclose(towers, untowered, rtol=1e-5, atol=1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
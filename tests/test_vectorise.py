@@ -0,0 +1,45 @@
+from tests.helpers import SystemTestCase
+import puddle.puddle as pd
+import unittest
+
+
+class VectoriseTest(SystemTestCase):
+    def test_mixed_ranks(self):
+        """Operands of different ranks broadcast as they would for one sample."""
+        x, y = pd.scalar(), pd.scalar(1.0, 2.0)
+        u = pd.dependent([x, y], [((8,), "tanh"), ((), "id")])
+        w = pd.dependent([x, y], [((8,), "tanh"), ((2,), "id")])
+        equations = [
+            pd.equate(pd.grad(u, [x, y])),
+            pd.equate(pd.multiply(w, u)),
+            pd.equate(pd.multiply(w, 2.0)),
+            pd.equate(w, 1.0),
+            pd.equate(pd.add(u, w), 0.5),
+            pd.equate(pd.laplacian(u, [x, y]), u),
+        ]
+        systems = self.compile_systems(
+            [x, y], equations, [{"vectorise": False}, {"vectorise": True}]
+        )
+        # Batches of two line the batch axis up with the vector axis
+        for size in [1, 2, 5]:
+            feed = self.make_feed([x, y], equations, size)
+            self.assertSameValues(systems, equations, feed)
+
+    def test_vector_spaces(self):
+        """Derivatives against vector spaces match between the two modes."""
+        v = pd.vector(3, -1.0, 1.0)
+        w = pd.dependent([v], [((8,), "tanh"), ((2,), "id")])
+        equations = [
+            pd.equate(pd.derivative(w, v), 0.0),
+            pd.equate(pd.div(pd.stack(w[0], w[1], w[0]), [v]), w[1]),
+            pd.equate(pd.stack(w, w, axis=1), 1.0),
+        ]
+        systems = self.compile_systems(
+            [v], equations, [{"vectorise": False}, {"vectorise": True}]
+        )
+        feed = self.make_feed([v], equations, 4)
+        self.assertSameValues(systems, equations, feed)
+
+
+if __name__ == "__main__":
+    unittest.main()